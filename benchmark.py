@@ -0,0 +1,173 @@
+from __future__ import print_function
+
+import json
+import os
+import platform
+import subprocess
+import time
+import timeit
+
+import numpy as np
+import scipy
+
+import cableStatics
+import installation
+import synthetic
+
+# Benchmarks of the solver and mapping hot paths on a synthetic terrain, so
+# they run without the Coweeta files.  Run from the repository directory:
+#
+#     python benchmark.py [--full] [--history benchmarkHistory.jsonl]
+#
+# Each run is appended as one JSON line to the history file and compared with
+# the previous run on the same host and Python.  The default history file is
+# kept out of git.
+
+
+# Mast layout as fractions of the synthetic terrain's extent: either side of
+# the upper valley and down it.
+MASTS = [[0.2, 0.8], [0.8, 0.75], [0.5, 0.25]]
+HEIGHTS = [70.0, 70.0, 80.0]
+MAP_PARAMS = dict(cableRes=5, heightRes=0.5, minClearance=2, maxTension=1500, weight=200)
+
+
+def measure(fn, repeat=5, minTime=0.2):
+    # Returns the best time of repeat runs of fn, in seconds per call.  Each
+    # run calls fn enough times to take about minTime.
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        t = timer.timeit(number)
+        if t >= minTime or number >= 1e6:
+            break
+        number *= max(2, min(10, int(minTime / max(t, 1e-9))))
+    return min([t] + timer.repeat(repeat - 1, number)) / number
+
+
+def setupInstallation(terrain):
+    lo, hi = terrain.range()
+    itcs = installation.InstalledTCS(terrain)
+    itcs.positionMasts(lo + (hi - lo) * np.array(MASTS), np.array(HEIGHTS))
+    return itcs
+
+
+def run(full=False, seed=0, repeat=5):
+    # Times each benchmark, returning a dict of name: seconds per call.
+    # full adds the finer platform maps, which take some minutes.
+    results = dict()
+    terrain = synthetic.SyntheticTerrain(seed=seed)
+    itcs = setupInstallation(terrain)
+
+    # A cable from a mast top to the platform in the middle of the layout
+    p = itcs.tcs.p
+    centre = np.mean(p, axis=0)
+    centre[2] = terrain.canopySurface(centre[:2]) + 20
+    cable = cableStatics.Cable(p[0][2], centre[2], cableStatics.horizDist(p[0], centre), 0.35)
+    cable.setHorizForce(500.0)
+
+    results['Cable.solveParams'] = measure(cable.solveParams, repeat)
+    results['Cable.setTension'] = measure(lambda: cable.setTension(1500.0, 0), repeat)
+
+    def tune():
+        itcs.tcs.setLoad(centre, 200)
+        itcs.tcs.tune()
+    results['TriCableSystem.tune'] = measure(tune, repeat)
+
+    lo, hi = terrain.range()
+    rs = np.random.RandomState(seed)
+    one = lo + (hi - lo) * rs.uniform(0.1, 0.9, 2)
+    many = lo + (hi - lo) * rs.uniform(0.1, 0.9, (1000, 2))
+    results['groundSurface[1]'] = measure(lambda: terrain.groundSurface(one), repeat)
+    results['groundSurface[1000]'] = measure(lambda: terrain.groundSurface(many), repeat)
+    results['canopySurface[1]'] = measure(lambda: terrain.canopySurface(one), repeat)
+    results['canopySurface[1000]'] = measure(lambda: terrain.canopySurface(many), repeat)
+
+    tune()
+    results['getTerrainBeneathCables'] = measure(lambda: itcs.getTerrainBeneathCables(MAP_PARAMS['cableRes']), repeat)
+
+    # Whole maps are timed once each, they're slow enough to be steady.
+    for gridRes in [40, 20] + ([10] if full else []):
+        for vectorized in [False, True]:
+            name = 'platformMap[gridRes={}{}]'.format(gridRes, ', vectorized' if vectorized else '')
+            t = time.time()
+            itcs.platformMap(gridRes=gridRes, vectorized=vectorized, **MAP_PARAMS)
+            results[name] = time.time() - t
+
+    return results
+
+
+def gitCommit():
+    try:
+        with open(os.devnull, 'w') as null:
+            out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=null,
+                                          cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(results, path, seed=0, full=False):
+    # Appends a run to the history at path and returns it as recorded.
+    entry = dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'), host=platform.node(), python=platform.python_version(),
+                 numpy=np.__version__, scipy=scipy.__version__, commit=gitCommit(), seed=seed, full=full,
+                 results=results)
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+    return entry
+
+
+def history(path):
+    # Returns the runs recorded at path, oldest first.
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous(runs, seed=0, host=None, python=None):
+    # Returns the latest of runs on the terrain from seed on host with the
+    # given version of Python, this host and Python by default, or None.
+    host = host or platform.node()
+    python = python or platform.python_version()
+    for entry in reversed(runs):
+        if entry['host'] == host and entry['python'] == python and entry['seed'] == seed:
+            return entry
+    return None
+
+
+def report(results, base=None, threshold=0.2):
+    # Prints each time and, given an earlier run, its ratio to that run's,
+    # flagging those more than threshold slower.  Returns the names of the
+    # flagged ones.
+    slower = []
+    if base is not None:
+        print('Compared with {} at {}'.format(base.get('commit'), base['time']))
+    for name in sorted(results):
+        line = '{:45s} {:12.6g} s'.format(name, results[name])
+        old = base['results'].get(name) if base is not None else None
+        if old:
+            ratio = results[name] / old
+            line += '  {:6.2f}x'.format(ratio)
+            if ratio > 1 + threshold:
+                line += '  SLOWER'
+                slower.append(name)
+        print(line)
+    return slower
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Times the solver and mapping hot paths on a synthetic terrain.')
+    parser.add_argument('--history', default='benchmarkHistory.jsonl', help='JSON lines file of past runs')
+    parser.add_argument('--full', action='store_true', help='include the slow, finer platform maps')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic terrain seed')
+    parser.add_argument('--repeat', type=int, default=5, help='repeats of each quick benchmark')
+    parser.add_argument('--threshold', type=float, default=0.2, help='fraction slower to flag as a regression')
+    parser.add_argument('--no-record', dest='record', action='store_false', help="don't add this run to the history")
+    args = parser.parse_args()
+
+    base = previous(history(args.history), args.seed)
+    results = run(args.full, args.seed, args.repeat)
+    if args.record:
+        record(results, args.history, args.seed, args.full)
+    report(results, base, args.threshold)
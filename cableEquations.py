@@ -214,9 +214,9 @@ print(c.tension(10))
 
 reload(cs)
 c = cs.Cable(z1=10, z2=5, w=10, unitWeight=0.35)
-c.setTension(ten=12.21545251, x=0)
+print(c.setTension(ten=12.21545251, x=0))
 print(c.th)
-c.setTension(ten=10.4654525134, x=10)
+print(c.setTension(ten=10.4654525134, x=10))
 print(c.th)
 
 # <codecell>
@@ -76,20 +76,192 @@ class Cable:
         self.zc = self.z1 - a * np.cosh(self.xc / a)
 
 
-    def setTension(self, ten, x):
+    def tensionSlope(self, x):
+        # Returns the rate of change of the total tension at x with respect to
+        # th, holding the end points fixed.  See CableArray.tensionSlope.
+        a = self.a
+        h = self.w / (2 * a)
+        q = (self.z2 - self.z1) / (2 * a * np.sinh(h))
+        u = (x + self.xc) / a
+        return np.cosh(u) - np.sinh(u) * ((x - self.w / 2) / a + q * (1 - h / np.tanh(h)) / np.sqrt(1 + q * q))
+
+
+    def setTension(self, ten, x, tol=1e-10, maxIter=100):
         # Calculate the (uniform) horizontal component of tension in the cable
         # required to give a total tension of 'ten' at location 'x'.
-        # Determined numerically using least squares.
+        # Determined numerically with a bracketed Newton's method, see
+        # CableArray.setTension.  The cable is left set to the last force
+        # tried.  Returns True if that gives ten to within tol, or nearly so,
+        # and False if there is no such tension on the taut side of the
+        # cable's minimum tension or maxIter iterations didn't find it.
+        lo, hi = 0.0, float(ten)
+        th = hi
+        taut, err = False, np.inf
+        with np.errstate(all='ignore'):
+            for n in range(maxIter):
+                self.setHorizForce(th)
+                err = self.tension(x) - ten
+                slope = self.tensionSlope(x)
+                taut = slope > 0
+                if taut and abs(err) <= tol * ten:
+                    return True
+
+                if taut and err > 0:
+                    hi = th
+                else:
+                    lo = th
+                if hi - lo <= tol * hi:
+                    break
+
+                step = th - err / slope if taut else lo
+                th = step if lo < step < hi else 0.5 * (lo + hi)
+
+            return bool(taut and abs(err) <= 1e-6 * ten)
+
+
+
+
+class CableArray:
+    # Array counterpart to Cable.  Models many independent static cables at
+    # once.  Each of z1, z2, w and unitWeight may be an array (all of the same
+    # shape, or broadcastable to it) with one element per cable, so a whole
+    # batch of catenaries is solved with a few numpy passes.
+    #
+    # Where a method takes a position x it may be a scalar (the same position
+    # on every cable), an array the shape of the cables, or an array with
+    # extra trailing dimensions giving several positions along each cable.
+
+    def __init__(self, z1, z2, w, unitWeight):
+        self.z1 = np.asarray(z1, dtype=float)
+        self.z2 = np.asarray(z2, dtype=float)
+        self.w = np.asarray(w, dtype=float)
+        self.unitWeight = np.asarray(unitWeight, dtype=float)
+        self.shape = np.broadcast(self.z1, self.z2, self.w, self.unitWeight).shape
+
+
+    def setHorizForce(self, th):
+        # Specify the horizontal component of the tension of every cable.
+        self.th = np.ones(self.shape) * th
+        self.a = self.th / self.unitWeight
+        self.solveParams()
+
+
+    def _expand(self, v, x):
+        # Reshape the per cable values v so they broadcast against positions
+        # x that have extra trailing dimensions.
+        x = np.asarray(x)
+        if x.ndim > v.ndim:
+            v = v.reshape(v.shape + (1,) * (x.ndim - v.ndim))
+        return v
+
+
+    def cableZ(self, x):
+        # Returns the height of each cable at horizontal position x.
+        a, xc, zc = [self._expand(v, x) for v in (self.a, self.xc, self.zc)]
+        return a * np.cosh((x + xc) / a) + zc
 
-        def error(th):
-            self.setHorizForce(th)
-            calcTen = self.tension(x)
-            return ten - calcTen
 
-        res = spipyopt.leastsq(error, [ten])
-        self.th = res[0][0]
+    def length(self):
+        # Returns the total length of each cable from start to end
+        return self.a * (np.sinh((self.w + self.xc) / self.a) - np.sinh(self.xc / self.a))
+
+
+    def verticalForce(self, x):
+        # Returns the vertical component of tension of each cable at x
+        a, xc, th = [self._expand(v, x) for v in (self.a, self.xc, self.th)]
+        return np.sinh((x + xc) / a) * th
+
+
+    def tension(self, x):
+        # Returns the total tension of each cable at x.  This is th cosh(), the
+        # same as combining the vertical and horizontal components.
+        a, xc, th = [self._expand(v, x) for v in (self.a, self.xc, self.th)]
+        return np.cosh((x + xc) / a) * th
+
+
+    def tensionSlope(self, x):
+        # Returns the rate of change of the total tension at x with respect to
+        # th, holding the end points fixed.  With u = (x + xc) / a and
+        # h = w / 2a, differentiating th cosh(u) and the expression for xc in
+        # solveParams gives
+        #
+        #   cosh(u) - sinh(u) ((x - w / 2) / a + q (1 - h coth(h)) / sqrt(1 + q^2))
+        #
+        # where q = (z2 - z1) / (2 a sinh(h)).
+        a, xc, w, z1, z2 = [self._expand(v, x) for v in (self.a, self.xc, self.w, self.z1, self.z2)]
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            h = w / (2 * a)
+            q = (z2 - z1) / (2 * a * np.sinh(h))
+            u = (x + xc) / a
+            return np.cosh(u) - np.sinh(u) * ((x - w / 2) / a + q * (1 - h / np.tanh(h)) / np.sqrt(1 + q * q))
+
+
+    def setTension(self, ten, x, tol=1e-10, maxIter=100):
+        # Array counterpart to Cable.setTension.  Sets the horizontal force of
+        # every cable so the total tension at x is ten (either may be an
+        # array the shape of the cables).  Returns a mask of the cables where
+        # this was achieved.
+        #
+        # Total tension th cosh(u) is never less than th, so th = ten bounds
+        # the solution from above.  Below that the tension falls to a minimum
+        # and then rises again as the cable goes slack.  So the upper bound
+        # only moves down to a trial th which is both taut and too tense,
+        # every other trial th is below the solution.  Newton steps using
+        # tensionSlope are taken from th = ten, falling back to bisection
+        # whenever a step would leave the bracket.
+        ten, x, z1, z2, w, uw = [(np.ones(self.shape) * v).ravel()
+                                 for v in (ten, x, self.z1, self.z2, self.w, self.unitWeight)]
+
+        lo = np.zeros(ten.shape)
+        hi = ten.copy()
+        th = ten.copy()
+        err = np.ones(ten.shape) * np.inf
+        taut = np.zeros(ten.shape, dtype=bool)
+        active = ten > 0
+        with np.errstate(all='ignore'):
+            for n in range(maxIter):
+                sel = np.flatnonzero(active)
+                if sel.size == 0:
+                    break
+
+                c = CableArray(z1[sel], z2[sel], w[sel], uw[sel])
+                c.setHorizForce(th[sel])
+                e = c.tension(x[sel]) - ten[sel]
+                slope = c.tensionSlope(x[sel])
+                err[sel] = e
+                taut[sel] = t = slope > 0
+
+                high = t & (e > 0)
+                hi[sel[high]] = th[sel[high]]
+                lo[sel[~high]] = th[sel[~high]]
+
+                active[sel] = ~(t & (np.abs(e) <= tol * ten[sel])) & (hi[sel] - lo[sel] > tol * hi[sel])
+
+                step = np.where(t, th[sel] - e / slope, lo[sel])
+                bad = ~((step > lo[sel]) & (step < hi[sel]))
+                step[bad] = 0.5 * (lo[sel] + hi[sel])[bad]
+                th[sel] = np.where(active[sel], step, th[sel])
+
+        self.setHorizForce(th.reshape(self.shape))
+        return (taut & (np.abs(err) <= 1e-6 * ten)).reshape(self.shape)
 
 
+    def solveParams(self):
+        # As Cable.solveParams, determine the offsets xc and zc for every
+        # cable.  Rather than the sympy derived expression this uses the
+        # equivalent
+        #
+        #   z2 - z1 = 2 a sinh((2 xc + w) / 2a) sinh(w / 2a)
+        #
+        # which can be solved for xc directly and doesn't overflow for large
+        # w / a as soon.
+        a = self.a
+        w = self.w
+        zd = self.z2 - self.z1
+
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            self.xc = a * np.arcsinh(zd / (2 * a * np.sinh(w / (2 * a)))) - w / 2
+            self.zc = self.z1 - a * np.cosh(self.xc / a)
 
 
 def planMag(v):
@@ -188,18 +360,129 @@ class TriCableSystem:
 
 
     def tune(self):
+        self.evaluations = 0
         okay = self.simpleForces()
         if not okay:
             return False
 
         self.setup()
 
-        res = spipyopt.leastsq(self.tryth, [1])
+        res = spipyopt.leastsq(self.tryth, [1], full_output=True)
+        self.evaluations = res[2]['nfev']
         k = res[0][0]
         self.th *= k
         return True
 
 
+    def tuneMany(self, pb, weight):
+        # Array counterpart of setLoad() followed by tune() for M platform
+        # positions at once.  pb is an (M, 3) array of positions and weight is
+        # a scalar or an M element array.  The stacked 3x3 massless systems
+        # are solved together, then the sag correction factor k is found for
+        # all positions by a bracketed (Illinois) false position on the
+        # vertical force error of tryth().
+        #
+        # Returns (M, 3) arrays of th, the tension at each mast and the cable
+        # lengths, and an M element mask of positions where all cables are in
+        # tension.  The cables themselves are left in self.cables as a
+        # CableArray of shape (M, 3), and the number of position evaluations
+        # made finding k in self.evaluations.  The single position state (pb,
+        # c, th) is untouched.
+        pb = np.array(pb, dtype=float).reshape(-1, 3)
+        p = np.array(self.p, dtype=float)
+        m = len(pb)
+        weight = np.ones(m) * weight
+
+        # Unit vectors from the platform towards each anchor, shape (M, 3, 3)
+        dv = p[np.newaxis, :, :] - pb[:, np.newaxis, :]
+        dv /= np.sqrt(np.sum(np.square(dv), axis=2))[:, :, np.newaxis]
+
+        # Massless solution, as simpleForces().  Positions in the plane of
+        # the anchors can't be solved, swap in an identity so the stacked
+        # solve goes ahead and reject them.
+        A = np.transpose(dv, (0, 2, 1))
+        singular = np.abs(np.linalg.det(A)) < 1e-12
+        A[singular] = np.eye(3)
+        b = np.zeros((m, 3, 1))
+        b[:, 2, 0] = weight
+        tensions = np.linalg.solve(A, b)[:, :, 0]
+        th0 = tensions * np.sqrt(np.square(dv[:, :, 0]) + np.square(dv[:, :, 1]))
+        okay = ~singular & np.all(th0 > 0, axis=1)
+
+        w = np.sqrt(np.square(pb[:, 0, np.newaxis] - p[:, 0]) + np.square(pb[:, 1, np.newaxis] - p[:, 1]))
+        z1 = np.ones(w.shape) * p[:, 2]
+        z2 = np.ones(w.shape) * pb[:, 2, np.newaxis]
+
+        def catenary(k, sel):
+            c = CableArray(z1[sel], z2[sel], w[sel], self.unitWeight)
+            c.setHorizForce(th0[sel] * k[:, np.newaxis])
+            return c
+
+        self.evaluations = 0
+
+        def error(k, sel):
+            # As tryth(), the out of balance vertical force.
+            c = catenary(k, sel)
+            self.evaluations += len(k)
+            return weight[sel] + np.sum(c.verticalForce(c.w), axis=1)
+
+        # The error falls as k grows, so first bracket the root by doubling
+        # or halving k from 1.  A non-finite error means the cable sags so
+        # far the catenary overflows; it is treated as positive.
+        with np.errstate(all='ignore'):
+            lo = np.ones(m)
+            hi = np.ones(m)
+            flo = error(lo, slice(None))
+            flo[~np.isfinite(flo)] = np.inf
+            fhi = flo.copy()
+            for n in range(60):
+                grow = okay & (fhi > 0)
+                if not np.any(grow):
+                    break
+                lo[grow], flo[grow] = hi[grow], fhi[grow]
+                hi[grow] *= 2
+                fhi[grow] = error(hi[grow], grow)
+            for n in range(60):
+                shrink = okay & (flo < 0)
+                if not np.any(shrink):
+                    break
+                hi[shrink], fhi[shrink] = lo[shrink], flo[shrink]
+                lo[shrink] *= 0.5
+                f = error(lo[shrink], shrink)
+                f[~np.isfinite(f)] = np.inf
+                flo[shrink] = f
+            okay &= (flo >= 0) & (fhi <= 0)
+
+            k = lo.copy()
+            side = np.zeros(m)
+            for n in range(100):
+                active = okay & (hi - lo > 1e-12 * hi) & (np.abs(flo) > 1e-9 * weight)
+                if not np.any(active):
+                    break
+                k[active] = (lo * fhi - hi * flo)[active] / (fhi - flo)[active]
+                bad = active & ~((k > lo) & (k < hi))
+                k[bad] = 0.5 * (lo + hi)[bad]
+                f = np.zeros(m)
+                f[active] = error(k[active], active)
+                up = active & (f > 0)
+                down = active & (f <= 0)
+                lo[up], flo[up] = k[up], f[up]
+                hi[down], fhi[down] = k[down], f[down]
+                # Illinois modification, halve the error at a stale end
+                fhi[up & (side > 0)] *= 0.5
+                flo[down & (side < 0)] *= 0.5
+                side[up] = 1
+                side[down] = -1
+            k = np.where(np.abs(flo) <= np.abs(fhi), lo, hi)
+
+            self.cables = catenary(k, slice(None))
+            ten = self.cables.tension(0)
+            lengths = self.cables.length()
+
+        okay &= np.all(np.isfinite(ten), axis=1)
+        return self.cables.th, ten, lengths, okay
+
+
     def calcCeiling(self):
         A = np.array([self.p[i] for i in range(3)])
         A[:,2] = 1
@@ -4,88 +4,135 @@ import matplotlib.pyplot as plt
 from matplotlib import cm
 from mpl_toolkits.mplot3d import Axes3D
 
-import osgeo.ogr as oo
-import scipy.ndimage
-
-import gdal
 import json
+import os
+
+import terrain
+
+
+
+class Coweeta(terrain.RasterTerrain):
+    def __init__(self, window=None, dtype='float64', storeDir=None, bundle=None):
+        # Opens the basin DEM.  By default all of it is read into memory.
+        #
+        # window limits reading to a rectangle given by two (x,y) corners in
+        # the DEM's own (UTM) coordinates.  dtype sets how the ground layer is
+        # stored, 'float32' or 'int16' use a quarter or a half of the memory
+        # of 'float64'.  If storeDir is given the layer is kept in a memory
+        # mapped file in that directory rather than in memory.  The canopy is
+        # composed from the ground layer as it is sampled.
+        #
+        # If bundle is given everything is instead loaded from a bundle
+        # written by bake(), without GDAL or OGR.
+        self.refPoint = (0, 0)
+        self.bundle = bundle
+        if bundle is not None:
+            self.loadBundle(bundle)
+            return
+
+        import gdal
+        self.g = gdal.Open('cwt_dem/w001001.adf')
+        self.gt = self.g.GetGeoTransform()
+        self.dtype = dtype
+        self.storeDir = storeDir
 
+        self.readDem(window)
 
 
-class Coweeta:
-    def __init__(self):
-        self.g = gdal.Open('cwt_dem/w001001.adf')
-
-        a = self.g.ReadAsArray()
-        self.zg = np.array(a, dtype=float)
-        self.zg[a == -32768] = np.NaN
-        self.zg = self.zg.transpose()
-        self.zg0 = self.zg.copy()
-        self.zg0[np.isnan(self.zg0)] = 0
+    def readDem(self, window=None):
+        # (Re)reads the DEM, or just the part of it within window, see
+        # __init__.
+        if self.bundle is not None:
+            raise RuntimeError('DEM is from a bundle, it can only be read with GDAL', self.bundle)
 
-        self.gt = self.g.GetGeoTransform()
-        self.step = np.array([self.gt[1], self.gt[5]])
-        self.origin = np.array([self.gt[0], self.gt[3]])
+        gt = self.gt
+        xoff, yoff, nx, ny = 0, 0, self.g.RasterXSize, self.g.RasterYSize
+        if window is not None:
+            cols = (np.array([window[0][0], window[1][0]]) - gt[0]) / gt[1]
+            rows = (np.array([window[0][1], window[1][1]]) - gt[3]) / gt[5]
+            xoff = int(np.clip(np.floor(cols.min()), 0, nx))
+            yoff = int(np.clip(np.floor(rows.min()), 0, ny))
+            nx = int(np.clip(np.ceil(cols.max()) + 1, xoff, nx)) - xoff
+            ny = int(np.clip(np.ceil(rows.max()) + 1, yoff, ny)) - yoff
 
-        self.zCanopy = self.zg0 + 30  #TEMP!!! assume all trees are 30m high
+        a = self.g.ReadAsArray(xoff, yoff, nx, ny).transpose()
+        self.noData = terrain.storeArray(a == -32768, self.storeDir, 'noData')
+        zg0, scale, offset = terrain.compactLayer(a, self.dtype, nodata=-32768)
+        del a
+        zg0 = terrain.storeArray(zg0, self.storeDir, 'ground')
 
+        self.window = (xoff, yoff, nx, ny)
+        self.worldOrigin = np.array([gt[0] + xoff * gt[1], gt[3] + yoff * gt[5]])
+        origin = self.worldOrigin - self.refPoint
 
-    def setWorkingRefPoint(self, loc):
-        # Set a local reference point.
-        self.refPoint = loc
-        self.origin = np.array([self.gt[0] - loc[0], self.gt[3] - loc[1]])
+        self.canopyHeight = 30  #TEMP!!! assume all trees are 30m high
 
+        terrain.RasterTerrain.__init__(self, zg0, self.canopyHeight, origin, [gt[1], gt[5]], scale=scale,
+                                       offset=offset)
 
-    def surfaceMesh(self, p1, p2):
 
-        p1i, p2i = self.locationToIndices(p1), self.locationToIndices(p2)
+    def readWindow(self, points, margin=0):
+        # Re-reads only the part of the DEM around points, given in working
+        # coordinates, e.g. the mast positions.  margin extends the bounding
+        # box of the points on all sides.
+        pts = np.array(points, dtype=float) + self.refPoint
+        self.readDem((pts.min(axis=0) - margin, pts.max(axis=0) + margin))
 
-        p1i, p2i = np.min([p1i, p2i], axis=0), np.max([p1i, p2i], axis=0)
 
-        p1i = np.array(np.floor(np.max([p1i, (0, 0)],        axis=0)), dtype=int)
-        p2i = np.array(np.ceil( np.min([p2i, self.zg.shape], axis=0)), dtype=int)
+    def setWorkingRefPoint(self, loc):
+        # Set a local reference point.
+        self.refPoint = loc
+        self.origin = self.worldOrigin - loc
 
-        xi, yi = [np.arange(p1i[a], p2i[a]) for a in [0, 1]]
-        xr, yr = [np.arange(p1i[a], p2i[a]) * self.step[a] + self.origin[a] for a in [0, 1]]
 
-        x, y = np.meshgrid(xr, yr)
-        z = self.zg[xi, np.reshape(yi, (len(yi), 1))]
+    def save(self, path):
+        # Writes the DEM as loaded, with its cubic spline coefficients, and
+        # any vector layers loaded to a bundle directory at path.  See bake().
+        if not os.path.isdir(path):
+            os.makedirs(path)
 
-        return x, y, z
+        np.save(os.path.join(path, 'ground.npy'), self.zg0)
+        np.save(os.path.join(path, 'noData.npy'), self.noData)
+        np.save(os.path.join(path, 'groundCubic.npy'), self.groundSampler.getCoefficients(3))
 
+        meta = dict(gt=list(self.gt), window=list(self.window), worldOrigin=list(self.worldOrigin),
+                    scale=self.groundSampler.scale, offset=self.groundSampler.offset,
+                    canopyHeight=self.canopyHeight)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
 
-    def locationToIndices(self, loc):
-        # Scales the given (x,y) coordinates to correspond with the indexing of
-        # the DEM array.
-        return (loc - self.origin) / self.step
+        for name in ['streamSegs', 'watershed', 'gradientPlot']:
+            if hasattr(self, name):
+                saveGeometries(path, {'streamSegs': 'streams'}.get(name, name), getattr(self, name))
 
 
-    def range(self):
-        # Returns two (x,y) points, one at either corner of the basin data.
-        return self.origin, self.origin + self.step * self.zg.shape
+    def loadBundle(self, path):
+        # Loads the DEM from a bundle written by save(), memory mapped.
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
 
+        self.g = None
+        self.gt = tuple(meta['gt'])
+        self.window = tuple(meta['window'])
+        self.worldOrigin = np.array(meta['worldOrigin'])
+        self.canopyHeight = meta['canopyHeight']
 
-    def groundSurface(self, loc):
-        # Returns the z coordinate on the ground surface at loc
-        locI = self.locationToIndices(loc)
-        if locI.shape == (2,):
-            z = scipy.ndimage.map_coordinates(self.zg0, locI.reshape(2,1))[0]
-        else:
-            z = scipy.ndimage.map_coordinates(self.zg0, locI.transpose())
-        return z
+        zg0 = np.load(os.path.join(path, 'ground.npy'), mmap_mode='r')
+        self.dtype = zg0.dtype.name
+        self.storeDir = None
+        self.noData = np.load(os.path.join(path, 'noData.npy'), mmap_mode='r')
 
-    def canopySurface(self, loc):
-        # Returns the z coordinate on the ground surface at loc
-        locI = self.locationToIndices(loc)
-        if locI.shape == (2,):
-            z = scipy.ndimage.map_coordinates(self.zCanopy, locI.reshape(2,1))[0]
-        else:
-            z = scipy.ndimage.map_coordinates(self.zCanopy, locI.transpose())
-        return z
+        terrain.RasterTerrain.__init__(self, zg0, self.canopyHeight, self.worldOrigin, [self.gt[1], self.gt[5]],
+                                       scale=meta['scale'], offset=meta['offset'])
+        self.groundSampler.coefficients[3] = np.load(os.path.join(path, 'groundCubic.npy'), mmap_mode='r')
 
 
     def loadStreams(self):
+        if self.bundle is not None:
+            self.streamSegs = loadGeometries(self.bundle, 'streams', asDict=False)
+            return
 
+        import osgeo.ogr as oo
         streams = oo.Open('coweeta_streams/coweeta_streams.dbf')
         layer = streams.GetLayerByIndex(0)
         numFeat = layer.GetFeatureCount()
@@ -99,7 +146,11 @@ class Coweeta:
 
 
     def loadWatersheds(self):
+        if self.bundle is not None:
+            self.watershed = loadGeometries(self.bundle, 'watershed')
+            return
 
+        import osgeo.ogr as oo
         self.watershed = dict()
         sws = oo.Open('coweeta_subwatersheds/coweeta_subwatersheds.dbf')
         layer = sws.GetLayerByIndex(0)
@@ -120,6 +171,11 @@ class Coweeta:
 
 
     def loadGradientPlots(self):
+        if self.bundle is not None:
+            self.gradientPlot = loadGeometries(self.bundle, 'gradientPlot')
+            return
+
+        import osgeo.ogr as oo
         self.gradientPlot = dict()
         plots = oo.Open('gradientPlots/Terrestrial_Gradient_80x80m_Plot.dbf')
         layer = plots.GetLayerByIndex(0)
@@ -168,3 +224,47 @@ class Coweeta:
         yc = (min(y) + 2 * max(y)) / 3
         return x, y, xc, yc
 
+
+
+def bake(path, window=None, dtype='float64'):
+    # One off conversion of the Coweeta DEM and vector layers (streams,
+    # watersheds and gradient plots) into a bundle directory at path.  Load it
+    # with Coweeta(bundle=path), which memory maps the arrays and needs
+    # neither GDAL nor OGR.  window and dtype are as for Coweeta().
+    cow = Coweeta(window=window, dtype=dtype)
+    cow.loadStreams()
+    cow.loadWatersheds()
+    cow.loadGradientPlots()
+    cow.save(path)
+    return cow
+
+
+def saveGeometries(path, name, geoms):
+    # Writes a list, or a dict with integer keys, of (N, 2 or 3) point arrays
+    # to path as a single array of all the points with an index of where each
+    # geometry starts.
+    keys = sorted(geoms.keys()) if isinstance(geoms, dict) else None
+    parts = [np.asarray(geoms[k]) for k in keys] if keys is not None else [np.asarray(g) for g in geoms]
+    starts = np.cumsum([0] + [len(p) for p in parts])
+    width = max([p.shape[1] for p in parts] + [2])
+
+    points = np.zeros((starts[-1], width))
+    for p, s in zip(parts, starts):
+        points[s:s + len(p), :p.shape[1]] = p
+
+    np.save(os.path.join(path, name + '.npy'), points)
+    np.save(os.path.join(path, name + 'Index.npy'),
+            np.column_stack((starts[:-1], starts[1:], keys if keys is not None else np.arange(len(parts)),
+                             [p.shape[1] for p in parts])))
+
+
+def loadGeometries(path, name, asDict=True):
+    # Reads geometries written by saveGeometries(), returning a dict of point
+    # arrays or, if asDict is False, a list.  Each array is a view of the
+    # memory mapped points.
+    points = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    index = np.load(os.path.join(path, name + 'Index.npy'))
+    geoms = [points[s:e, :w] for s, e, k, w in index]
+    if not asDict:
+        return geoms
+    return dict((int(k), g) for (s, e, k, w), g in zip(index, geoms))
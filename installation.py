@@ -1,10 +1,16 @@
 import numpy as np
+import scipy.ndimage
 import cableStatics
+import instrumentation
+import mapCache
 
 class InstalledTCS:
 
     def __init__(self, terrain):
         self.terrain = terrain
+        self.polarRes = None
+        self.profiles = None
+        self.stats = instrumentation.SolverStats()
 
 
     def positionMasts(self, xyPos, height):
@@ -12,7 +18,7 @@ class InstalledTCS:
         self.mastX = [xyPos[i][0] for i in range(3)]
         self.mastY = [xyPos[i][1] for i in range(3)]
 
-        self.mastBaseZ = self.terrain.groundSurface(xyPos)
+        self.mastBaseZ = self._sample(self.terrain.groundSurface, xyPos)
         self.mastTopZ = self.mastBaseZ + height
         anchorPos = np.zeros((3, 3))
         anchorPos[:, 0:2] = xyPos
@@ -21,11 +27,74 @@ class InstalledTCS:
         self.tcs = cableStatics.TriCableSystem(anchorPos, 0.35)
 
 
-    def positionPlatform(self, xyPos, height, weight):
-        z = self.terrain.groundSurface(xyPos) + height
+    def positionPlatform(self, xyPos, height, weight, ground=None):
+        # Places the platform, carrying weight, height above the ground at
+        # xyPos.  ground may give the ground height there if it's known.
+        if ground is None:
+            ground = self._sample(self.terrain.groundSurface, xyPos)
+        z = ground + height
         pb = [xyPos[0], xyPos[1], z]
         self.tcs.setLoad(pb, weight)
-        return self.tcs.tune()
+        return self._tune()
+
+
+    def _tune(self):
+        # self.tcs.tune(), counted and timed in stats.
+        with self.stats.timer('tune'):
+            okay = self.tcs.tune()
+        self.stats.count('leastsqEvaluations', getattr(self.tcs, 'evaluations', 0))
+        return okay
+
+
+    def _sample(self, surface, *args):
+        # Looks up surface, a method of the terrain, counting the call and
+        # the points looked up in stats.
+        with self.stats.timer('terrain'):
+            z = surface(*args)
+        self.stats.count('terrainPoints', np.size(z))
+        return z
+
+
+    def usePolarProfiles(self, rangeRes=2.0, bearingRes=None):
+        # Take the terrain beneath the cables from a polar profile table per
+        # mast (see PolarProfile) rather than sampling the terrain along each
+        # cable afresh.  rangeRes is the table's spacing along each bearing
+        # and bearingRes its angular spacing in radians, by default the one
+        # that gives rangeRes spacing at the far end.  The tables are built
+        # when first needed and only rebuilt when the masts move.  Pass
+        # rangeRes=None to sample the terrain directly again.
+        self.polarRes = None if rangeRes is None else (rangeRes, bearingRes)
+        self.profiles = None
+
+
+    def getProfiles(self):
+        # Returns the PolarProfile for each mast, building them if the masts
+        # have moved since they were last built.
+        xy = np.array([[self.tcs.p[i][0], self.tcs.p[i][1]] for i in range(3)])
+        if self.profiles is not None and np.array_equal(self.profileMasts, xy):
+            return self.profiles
+
+        rangeRes, bearingRes = self.polarRes
+        # No point inside the mast triangle is further from a mast than the
+        # longest side.
+        maxRange = max([np.hypot(*(xy[i] - xy[i - 1])) for i in range(3)])
+        if bearingRes is None:
+            bearingRes = rangeRes / maxRange
+
+        timer = self.stats.timer('profiles').start()
+        self.profiles = []
+        for i in range(3):
+            # Bearings to the other two masts bound the triangle's interior.
+            a1, a2 = [np.arctan2(*(xy[j] - xy[i])[::-1]) for j in ((i + 1) % 3, (i + 2) % 3)]
+            span = np.mod(a2 - a1, 2 * np.pi)
+            if span > np.pi:
+                a1, span = a2, 2 * np.pi - span
+            margin = 2 * bearingRes
+            self.profiles.append(PolarProfile(self.terrain, xy[i], a1 - margin, a1 + span + margin, maxRange,
+                                              rangeRes, bearingRes))
+        self.profileMasts = xy
+        timer.stop()
+        return self.profiles
 
 
     def getTerrainBeneathCables(self, resolution):
@@ -33,6 +102,8 @@ class InstalledTCS:
         zt = range(3)
         zg = range(3)
 
+        profiles = self.getProfiles() if self.polarRes else None
+
         for i in range(3):
             numPoints = np.ceil(self.tcs.c[i].w / resolution)
             x = np.linspace(self.tcs.p[i][0], self.tcs.pb[0], numPoints)
@@ -40,10 +111,18 @@ class InstalledTCS:
 
             d[i] = np.linspace(0, self.tcs.c[i].w, numPoints)
 
+            if profiles is not None:
+                prof = profiles[i]
+                bearing = prof.relativeBearing(self.tcs.pb[0] - self.tcs.p[i][0], self.tcs.pb[1] - self.tcs.p[i][1])
+                if prof.covers(bearing, self.tcs.c[i].w):
+                    zt[i] = prof.sample(prof.canopy, bearing, d[i])
+                    zg[i] = prof.sample(prof.ground, bearing, d[i])
+                    continue
+
             loc = np.array((x, y)).transpose()
 
-            zt[i] = self.terrain.canopySurface(loc)
-            zg[i] = self.terrain.groundSurface(loc)
+            zt[i] = self._sample(self.terrain.canopySurface, loc)
+            zg[i] = self._sample(self.terrain.groundSurface, loc)
 
 
         return d, zt, zg
@@ -59,7 +138,75 @@ class InstalledTCS:
 
 
 
-    def platformMap(self, cableRes, gridRes, heightRes, minClearance, maxTension, weight, showProgress=False):
+    def cablesClear(self, minClearance, resolution, leafSize=8, spanSize=32):
+        # Returns True if all three cables clear the canopy by minClearance at
+        # every point getTerrainBeneathCables(resolution) would sample, the
+        # same test as getCableClearance() giving at least minClearance.
+        #
+        # Rather than sampling every point, the cables are split into spans
+        # of spanSize points.  The lowest point of a catenary over a span is
+        # at one end or at its vertex, and the terrain's canopyMaxOver()
+        # bounds the canopy beneath it, so most spans are proved clear without
+        # any sampling.  Spans that can't be are halved, and sampled once down
+        # to leafSize points.
+        #
+        # Proving spans clear costs more per point than sampling them, so
+        # this only pays off for cables sampled finely.  On the synthetic
+        # terrain, with cables a few hundred metres long, it was about 1.5x
+        # slower than sampling at a resolution of 5m, about even at 1m and
+        # twice as fast at 0.25m.
+        c = [self.tcs.c[i] for i in range(3)]
+        w, a, xc, zc = [np.array([getattr(c[i], k) for i in range(3)], dtype=float) for k in ('w', 'a', 'xc', 'zc')]
+        p0 = np.array([self.tcs.p[i][:2] for i in range(3)], dtype=float)
+        dp = np.array(self.tcs.pb[:2], dtype=float) - p0
+        numPoints = np.array(np.ceil(w / resolution), dtype=int)
+        step = 1.0 / np.maximum(numPoints - 1, 1)
+
+        # Each span is a row of (cable, first point, last point)
+        spans = []
+        for i in range(3):
+            starts = np.arange(0, numPoints[i], spanSize)
+            spans.append(np.column_stack((np.ones(len(starts), dtype=int) * i, starts,
+                                          np.minimum(starts + spanSize, numPoints[i]) - 1)))
+        spans = np.concatenate(spans)
+
+        def cableZ(i, d):
+            return a[i] * np.cosh((d + xc[i]) / a[i]) + zc[i]
+
+        while spans.size:
+            i, j0, j1 = spans[:, 0], spans[:, 1], spans[:, 2]
+            t0, t1 = j0 * step[i], j1 * step[i]
+
+            low = np.minimum(cableZ(i, t0 * w[i]), cableZ(i, t1 * w[i]))
+            vertex = (-xc[i] > t0 * w[i]) & (-xc[i] < t1 * w[i])
+            low[vertex] = (a + zc)[i[vertex]]
+
+            top = self._sample(self.terrain.canopyMaxOver, p0[i] + t0[:, np.newaxis] * dp[i],
+                               p0[i] + t1[:, np.newaxis] * dp[i])
+            spans = spans[~(low - top >= minClearance)]
+
+            leaf = spans[:, 2] - spans[:, 1] < leafSize
+            if np.any(leaf):
+                k, k0, k1 = spans[leaf].transpose()
+                count = k1 - k0 + 1
+                ci = np.repeat(k, count)
+                j = np.repeat(k0 - np.cumsum(count) + count, count) + np.arange(np.sum(count))
+                t = j * step[ci]
+                zt = self._sample(self.terrain.canopySurface, p0[ci] + t[:, np.newaxis] * dp[ci])
+                if np.any(cableZ(ci, t * w[ci]) - zt < minClearance):
+                    return False
+
+            spans = spans[~leaf]
+            mid = (spans[:, 1] + spans[:, 2]) // 2
+            spans = np.concatenate((np.column_stack((spans[:, 0], spans[:, 1], mid)),
+                                    np.column_stack((spans[:, 0], mid + 1, spans[:, 2]))))
+
+        return True
+
+
+    def platformMap(self, cableRes, gridRes, heightRes, minClearance, maxTension, weight, showProgress=False,
+                    vectorized=False, chunkSize=2048, processes=1, pyramid=False, continuation=False,
+                    secant=False, guess=None, cache=None, monitor=None, status=False, checkpoint=None):
         """Maps the limits of platform height over its entire range.
 
         Also records cable tension at each location.
@@ -72,6 +219,81 @@ class InstalledTCS:
         all cables at a horizontal interval of cableRes along each only.
 
         This is a slow process.
+
+        If vectorized is True the grid cells are instead solved together as
+        numpy arrays, chunkSize cells at a time.  The ceiling and floor
+        bisections of every cell in a chunk advance in lockstep, so each step
+        is a handful of array operations rather than a solver call per cell.
+
+        processes sets the number of worker processes the vectorized chunks
+        are shared between, None for one per CPU.  The workers read the
+        terrain layers from shared memory where the terrain provides share().
+
+        If pyramid is True the scalar loop checks clearance with
+        cablesClear(), which bounds the canopy with a max pyramid and only
+        samples the terrain where the bound is inconclusive.  The terrain
+        must provide canopyMaxOver().  It only pays off with a cableRes of
+        about 1m or finer, at coarser ones the map is slower than plain
+        sampling.
+
+        If continuation is True the scalar loop sweeps the rows alternately
+        left and right and starts each cell from its solved neighbours: the
+        heights they predict here seed narrow search brackets, widened only
+        as far as needed.  The brackets are searched over the heights
+        bisection would end on, so where the tension and the clearance each
+        cross their limits once between the canopy and the ceiling the
+        heights found are exactly those of bisection.  A cell whose seeded
+        search fails is solved again without a seed, so its status is the
+        same too.  Cells without solved neighbours are bisected as usual.
+        On the synthetic terrain this saves about a fifth of the balances.
+
+        If secant is True the scalar loop narrows the height searches by the
+        secant method rather than bisection, interpolating the margin by
+        which the tension, or the clearance, is within its limit.  It steps
+        between the heights bisection would end on, so as with continuation
+        the heights found are bisection's where each margin crosses zero
+        once, and a cell whose search fails is solved again by bisection.
+        With pyramid only the sign of the clearance margin is known, so the
+        floor is still bisected.  On the synthetic terrain the secant method
+        saves about a third of the balances, and two fifths with
+        continuation.
+        The balances made are counted in self.stats, and for each cell in
+        self.stats.grids['balances'], to find the cells that are slow to
+        solve.
+
+        guess may give predicted ceiling and floor heights, a pair of arrays
+        over the map grid.  The scalar loop then seeds the height searches of
+        cells with them as continuation does.
+
+        cache is a mapCache.MapCache, or a directory for one, to keep maps in.
+        A map already in it for the same masts, load, parameters and terrain
+        is returned without being computed again.  Otherwise, for the scalar
+        loop, a coarser map of the same kind in it provides the guess.  A
+        guess only changes how quickly the heights are found, so a map is
+        kept under the same key whether or not one was used.
+
+        monitor receives the progress of the map, given the number of cells
+        to solve and then told as they're done.  It may be an
+        instrumentation.Progress, e.g. PrintProgress() to print the cells per
+        second and the time left every few seconds, or a function called as
+        monitor(done, total, cellsPerSecond, eta).  What the map's work was
+        spent on is added to self.stats.
+
+        A cell the platform can't be balanced at doesn't stop the map, it's
+        left without a solution.  If status is True the arrays returned are
+        followed by the status of each cell, one of the CellStatus codes:
+        whether it was solved, why not or if it was skipped.  Cells which
+        failed can be solved again with retryMap().
+
+        checkpoint is a directory to keep the map in as it's solved, a chunk
+        of rows at a time, as streamMap() does.  If the map is interrupted
+        the chunks already solved are taken from there when it's run again.
+        They're deleted once the map is complete.  The map is then solved as
+        if vectorized were True.
+
+        pyramid, continuation, secant and guess only apply to the scalar
+        loop, so giving them with vectorized, processes other than 1 or
+        checkpoint raises ValueError.
         """
 
         def progress(ch):
@@ -81,26 +303,139 @@ class InstalledTCS:
                 sys.stdout.write(ch)
                 sys.stdout.flush()
 
-        # used to determine if a point is within the mast defined triangle
-        import matplotlib.path as mplp
+        scalar = not (vectorized or processes != 1 or checkpoint is not None)
+        if not scalar and (pyramid or continuation or secant or guess is not None):
+            raise ValueError('pyramid, continuation, secant and guess only apply to the scalar loop, '
+                             'not with vectorized, processes or checkpoint')
 
-        def roundRange(vals, res):
-            '''returns a vector of
+        if cache is not None:
+            if not isinstance(cache, mapCache.MapCache):
+                cache = mapCache.MapCache(cache)
+            family = cache.family(self, cableRes, heightRes, minClearance, maxTension, weight)
+            # A guess only speeds the searches, the heights are the same
+            # without it, so it isn't part of the key.
+            if scalar:
+                options = (False, pyramid, continuation, secant)
+            else:
+                options = (True,)
+            path = cache.path(family, gridRes, options)
+            result = cache.load(path)
+            if result is None or (status and len(result) < 8):
+                if scalar and guess is None:
+                    # only the scalar loop is seeded by a guess
+                    coarse = cache.coarser(family, gridRes)
+                    if coarse is not None:
+                        guess = mapCache.resample(coarse, *self._mapGrid(gridRes)[:2])
+                result = self.platformMap(cableRes, gridRes, heightRes, minClearance, maxTension, weight,
+                                          showProgress=showProgress, vectorized=vectorized, chunkSize=chunkSize,
+                                          processes=processes, pyramid=pyramid, continuation=continuation,
+                                          secant=secant, guess=guess, monitor=monitor, status=True,
+                                          checkpoint=checkpoint)
+                cache.save(path, result, gridRes)
+            return result if status else result[:7]
 
-            The vector has values uniformly spaced by res.  The range is from
-            below the minimum value in vals to just above it.
-            '''
-            start = np.floor(np.min(vals) / res) * res
-            end = np.ceil(np.max(vals) / res) * res
-            return np.arange(start, end + res / 2, res)
+        monitor = instrumentation.progressMonitor(monitor)
+        timer = self.stats.timer('platformMap').start()
 
-        # Set the horizontal grid we will map over - it covers the whole range.
-        xr = roundRange([self.tcs.p[i][0] for i in range(3)], gridRes)
-        yr = roundRange([self.tcs.p[i][1] for i in range(3)], gridRes)
+        if not scalar:
+            result = self._platformMapVectorized(cableRes, gridRes, heightRes, minClearance, maxTension, weight,
+                                                 progress, chunkSize, processes, monitor, checkpoint)
+            timer.stop()
+            monitor.finish()
+            return result if status else result[:7]
 
-        # establish what is inside the triangle and what's not
-        bp = np.array([[self.tcs.p[i][j] for j in range(2)] for i in range(3)])
-        bounds = mplp.Path(bp, np.array([1, 2, 2], dtype='uint8'), closed=True)
+        xr, yr, bounds = self._mapGrid(gridRes)
+        monitor.start(self._mapCells(gridRes)[4].size)
+
+        # The terrain beneath the cables at the current cell's ceiling and
+        # the tensions at each height tried there.
+        beneath = [None, None]
+        tensions = dict()
+
+        def margin():
+            '''clearance of the cables over the canopy beyond minClearance'''
+            if pyramid:
+                # only whether they clear is known
+                return 1.0 if self.cablesClear(minClearance, cableRes) else -1.0
+            zc, mc = self.getCableClearance(d=beneath[0], zt=beneath[1])
+            return mc - minClearance
+
+        def balance(z):
+            '''tune the platform at height z, returning the mast tensions'''
+            self.stats.count('balances')
+            self.tcs.adjustPlatformElevation(z)
+            try:
+                okay = self._tune()
+            except np.linalg.LinAlgError:
+                raise CellError(CellStatus.SOLVER_FAILURE, 'ceiling error', ceiling, floor, x, y, z)
+            if not okay:
+                # we should really be able to solve the equations for this location ...
+                raise CellError(CellStatus.COMPRESSION, 'ceiling error', ceiling, floor, x, y, z)
+            return self.tcs.tensionAtMasts()
+
+        def tensionMargin(z):
+            '''1 / tension at height z beyond 1 / maxTension'''
+            tensions[z] = balance(z)
+            return 1.0 / max(tensions[z]) - 1.0 / maxTension
+
+        def clearanceMargin(z):
+            '''margin() with the platform at height z'''
+            ten = balance(z)
+            m = margin()
+            if not m < 0:
+                tensions[z] = ten
+            return m
+
+        def solveCell(seeds, secant):
+            '''the ceiling and floor at the current cell and the tensions at
+            each, or None if the cables can't clear the canopy'''
+            # start finding the maxTension ceiling.
+            tensions.clear()
+            self.tcs.setLoad((x, y, floor + clear * 0.5), weight)
+            if seeds or secant:
+                # Search outwards from the predicted ceiling, if there is one.
+                # The bracket starts as wide as the last prediction's error.
+                # The tension is infinite at the ceiling, where the cables are
+                # flat.
+                lastGoodZ = self._searchHeight(floor, clear, heightRes, tensionMargin, 1, floor + clear * 0.5,
+                                               seeds[0] if seeds else None, spread[0], secant,
+                                               (None, -1.0 / maxTension))
+                if seeds:
+                    spread[0] = max(heightRes, 2 * abs(lastGoodZ - seeds[0]))
+            else:
+                z = floor + clear * 0.5
+                lastGoodZ = self._bisectHeight(z, clear * 0.5, heightRes, tensionMargin, 1, z)
+            if lastGoodZ not in tensions:
+                tensionMargin(lastGoodZ)
+            lastGoodTen = tensions[lastGoodZ]
+
+            balance(lastGoodZ)
+
+            if not pyramid:
+                beneath[:] = self.getTerrainBeneathCables(resolution=cableRes)[:2]
+            ceilMargin = margin()
+            if ceilMargin < 0:
+                return None
+
+            clearance = lastGoodZ - floor
+            if clearance < 0:
+                raise CellError(CellStatus.SOLVER_FAILURE, 'ceiling through floor', x, y)
+
+            # now the lowest height that keeps clear of the canopy.
+            tensions.clear()
+            tensions[lastGoodZ] = lastGoodTen
+            if seeds or secant:
+                # With pyramid only the sign of the clearance margin is known
+                z = self._searchHeight(floor, clearance, heightRes, clearanceMargin, -1, lastGoodZ,
+                                       seeds[1] if seeds else None, spread[1], secant and not pyramid,
+                                       (ceilMargin, None))
+                if seeds:
+                    spread[1] = max(heightRes, 2 * abs(z - seeds[1]))
+            else:
+                z = self._bisectHeight(floor + clearance * 0.5, clearance * 0.5, heightRes, clearanceMargin,
+                                       -1, lastGoodZ)
+
+            return lastGoodZ, lastGoodTen, z, tensions[z]
 
         # Initialise our readings all to NaN by default
 
@@ -111,6 +446,9 @@ class InstalledTCS:
         zFloor = np.ones((yr.size, xr.size)) * np.NaN
         zCeil = np.ones((yr.size, xr.size)) * np.NaN
         zGround = np.ones((yr.size, xr.size)) * np.NaN
+        cellStatus = np.ones((yr.size, xr.size), dtype=np.int8) * CellStatus.UNSOLVED
+        cellBalances = np.zeros((yr.size, xr.size), dtype=int)
+        self.stats.grids['balances'] = cellBalances
 
         progress('This could take a while\n\n')
         # Optionally build the x axis for our progress report
@@ -122,10 +460,34 @@ class InstalledTCS:
             progress('{:>6}'.format('v'))
         progress('\n')
 
+        def solved(cell):
+            '''True if the grid cell (yi, xi) has been mapped'''
+            i, j = cell
+            return i < len(yr) and 0 <= j < len(xr) and not np.isnan(zFloor[i, j])
+
+        def mark(ch):
+            '''report the outcome at the current cell'''
+            if continuation:
+                row[xi] = ch
+            else:
+                progress(ch)
+
+        forward = True
+        spread = [heightRes, heightRes]
         for yi in reversed(range(len(yr))):
             y = yr[yi]
             progress('{:5}>'.format(int(y)))
-            for xi in range(len(xr)):
+
+            # A continuation sweep runs the rows alternately forwards and
+            # backwards, so each cell follows a solved neighbour.  The
+            # progress report for the row is then shown once it is done.
+            columns = list(range(len(xr)))
+            if continuation and not forward:
+                columns.reverse()
+            forward = not forward
+            row = [' '] * len(xr)
+
+            for xi in columns:
                 x = xr[xi]
                 p = (x,y)
 
@@ -134,98 +496,1205 @@ class InstalledTCS:
                 if not bounds.contains_point(p):
                     # We are outside the triangle formed by the three masts,
                     # skip this point.
-                    progress('.')
+                    mark('.')
+                    cellStatus[yi, xi] = CellStatus.OUTSIDE
                     continue
 
                 if any([(self.tcs.p[i][0] == x) and (self.tcs.p[i][1] == y) for i in range(3)]):
                     # we are right at a mast.  Skip.
-                    progress('#')
+                    mark('#')
+                    cellStatus[yi, xi] = CellStatus.AT_MAST
                     continue
 
                 # For this point determine the max height (with infinite tension)
                 # and the height above the canopy below.
+                self.stats.count('cells')
                 ceiling = self.tcs.ceiling(p)
-                floor = self.terrain.canopySurface(p)
+                floor = self._sample(self.terrain.canopySurface, p)
 
                 clear = ceiling - floor
 
                 if clear < 0:
                     # The canopy extends up above the ceiling
-                    progress('x')
+                    mark('x')
+                    cellStatus[yi, xi] = CellStatus.CANOPY_ABOVE_CEILING
+                    monitor.update()
                     continue
 
-                # start finding the maxTension ceiling.
-                step = clear * 0.5
-                z = floor + step
-                self.tcs.setLoad((x, y, z), weight)
-
-                if not self.tcs.tune():
-                    # we should really be able to solve the equations for this location ...
-                    raise RuntimeError('ceiling error', ceiling, floor, x, y, z)
-
-                lastGoodZ = z
-                lastGoodTen = self.tcs.tensionAtMasts()
-                while step > heightRes:
-                    step *= 0.5
-                    ten = self.tcs.tensionAtMasts()
-                    if max(ten) > maxTension:
-                        # Tension required for this height is too great, lower the platform.
-                        z -= step
-                    else:
-                        lastGoodZ = z
-                        lastGoodTen = ten
-                        z += step
-
-                    self.tcs.adjustPlatformElevation(z)
-
-                    if not self.tcs.tune():
-                        raise RuntimeError('ceiling error', ceiling, floor, x, y, z)
-
-                p3 = (x,y,lastGoodZ)
-                self.tcs.setLoad(p3, weight)
-                if not self.tcs.tune():
-                    raise RuntimeError('ceiling error', p3)
-
-                dist, zt, zg = self.getTerrainBeneathCables(resolution=cableRes)
-                zc, mc = self.getCableClearance(d=dist, zt=zt)
-                if mc < minClearance:
+                # Predict the heights here from the neighbouring cells solved
+                # so far, by the plane through them where there are three.
+                seeds = None
+                if continuation:
+                    back = xi + (1 if forward else -1)
+                    left, above, corner = (yi, back), (yi + 1, xi), (yi + 1, back)
+                    if solved(left) and solved(above) and solved(corner):
+                        seeds = [zc[left] + zc[above] - zc[corner] for zc in (zCeil, zFloor)]
+                    elif solved(left):
+                        seeds = [zCeil[left], zFloor[left]]
+                    elif solved(above):
+                        seeds = [zCeil[above], zFloor[above]]
+                if seeds is None and guess is not None and not np.isnan(guess[1][yi, xi]):
+                    seeds = [guess[0][yi, xi], guess[1][yi, xi]]
+
+                before = self.stats.counts.get('balances', 0)
+                try:
+                    try:
+                        res = solveCell(seeds, secant)
+                    except CellError:
+                        if not (seeds or secant):
+                            raise
+                        # Solve the cell again by bisection, so a seed or the
+                        # secant method can't change its status.
+                        res = solveCell(None, False)
+                except CellError as e:
+                    # Leave this cell unsolved and carry on with the rest, it
+                    # can be tried again with retryMap().
+                    cellStatus[yi, xi] = e.status
+                    mark('!')
+                    monitor.update()
+                    continue
+                finally:
+                    cellBalances[yi, xi] = self.stats.counts.get('balances', 0) - before
+
+                if res is None:
                     # even at maximum tension we can't ensure clearance of all
                     # cables.
-                    progress('_')
+                    mark('_')
+                    cellStatus[yi, xi] = CellStatus.NO_CLEARANCE
+                    monitor.update()
                     continue
 
-                zCeil[yi,xi] = lastGoodZ
-                ceilTen[yi,xi,:] = lastGoodTen
-                zGround[yi,xi] = floor
-
-                clearance = lastGoodZ - floor
-                if clearance < 0:
-                    raise RuntimeError('ceiling through floor')
-                step = clearance * 0.5
-                z = floor + step
-
-                while step > heightRes:
-                    step *= 0.5
-                    #TEMP!!! p3 = (x,y,z)
-                    self.tcs.adjustPlatformElevation(z)
-
-                    #TEMP!!! self.tcs.setLoad(p3, weight)
-                    if not self.tcs.tune():
-                        raise RuntimeError('ceiling error')
-                    zc, mc = self.getCableClearance(d=dist, zt=zt)
-
-                    if mc < minClearance:
-                        # we need to raise the platform
-                        z += step;
-                    else:
-                        lastGoodZ = z
-                        ten = self.tcs.tensionAtMasts()
-                        z -= step;
-
-                progress(chr(0x40 + int(z / 20) % 26))
-                floorTen[yi,xi, :] = ten
-                zFloor[yi,xi] = lastGoodZ
+                zCeil[yi, xi], ceilTen[yi, xi, :], z, floorTen[yi, xi, :] = res
+                zFloor[yi, xi] = z
+                zGround[yi, xi] = floor
+                cellStatus[yi, xi] = CellStatus.OK
+                mark(chr(0x40 + int(z / 20) % 26))
+                monitor.update()
+            if continuation:
+                progress(''.join(row))
             progress('\n')
 
+        timer.stop()
+        monitor.finish()
+        result = xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen, cellStatus
+        return result if status else result[:7]
+
+
+    def retryMap(self, result, cableRes, heightRes, minClearance, maxTension, weight, retry=None, chunkSize=2048):
+        """Solves again just the cells of a map which weren't solved.
+
+        result is a map as returned by platformMap(status=True), the other
+        arguments should be those it was made with.  The cells whose status
+        is one of retry, by default SOLVER_FAILURE and UNSOLVED, are solved
+        as platformMap(vectorized=True) does.  Its bracketed search for the
+        cables' sag often succeeds where leastsq in the scalar loop failed.
+
+        Returns a new result, with those cells and their status updated.
+        """
+        if retry is None:
+            retry = (CellStatus.SOLVER_FAILURE, CellStatus.UNSOLVED)
+
+        xr, yr = result[:2]
+        zCeil, zFloor, zGround, floorTen, ceilTen, cellStatus = [np.array(a) for a in result[2:8]]
+        xg, yg = [a.ravel() for a in np.meshgrid(xr, yr)]
+
+        cells = np.flatnonzero(np.isin(cellStatus.ravel(), retry))
+        for chunk in rowChunks(cells, xr.size, chunkSize):
+            res = self._mapChunk(chunk, xg[chunk], yg[chunk], cableRes, heightRes, minClearance, maxTension, weight)
+            idx, ceil, floor, ground, ften, cten, chunkStatus = res
+            cellStatus.ravel()[chunk] = chunkStatus
+            zCeil.ravel()[idx] = ceil
+            ceilTen.reshape(-1, 3)[idx] = cten
+            zGround.ravel()[idx] = ground
+            floorTen.reshape(-1, 3)[idx] = ften
+            zFloor.ravel()[idx] = floor
+
+        return xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen, cellStatus
+
+
+    def _bisectHeight(self, z, step, heightRes, f, sign, best):
+        # Bisection for the boundary between good and bad platform heights,
+        # f(z) being negative at bad heights.  Starting from z the height
+        # moves by sign * step from a good height and the other way from a
+        # bad one, halving the step each time until it is no more than
+        # heightRes.  Returns the last good height tried, or best if none
+        # were.
+        while step > heightRes:
+            step *= 0.5
+            if not f(z) < 0:
+                best = z
+                z += sign * step
+            else:
+                z -= sign * step
+        return best
+
+
+    def _searchHeight(self, lo, span, heightRes, f, sign, best, seed=None, width=None, secant=False,
+                      ends=(None, None)):
+        # Finds the height _bisectHeight(lo + span / 2, span / 2, heightRes, f,
+        # sign, best) would, f(z) being negative at bad heights.  Good heights
+        # are below bad ones if sign is 1, above them if it is -1.
+        #
+        # Bisection tries n heights, ending on a grid span / 2**n apart, and
+        # returns the good grid height nearest the bad ones, or best if none
+        # of those it tried were good.  The same grid is searched here.  Given
+        # a seed the search starts with a bracket of about width around it,
+        # which is moved and doubled until it holds the boundary.  If secant
+        # is True the bracket is then narrowed by the secant method, stepping
+        # to grid heights.  Ends are replaced by the Illinois rule, halving
+        # the value kept at an end that stays put for two steps, and a step
+        # bisects whenever the last two haven't halved the bracket.  Where f changes sign
+        # just once over the span, as bisection assumes, the height found is
+        # the one bisection finds, with fewer evaluations of f if the seed is
+        # close.  ends may give f at the good and bad ends of the span.
+        tests = 0
+        step = span * 0.5
+        while step > heightRes:
+            step *= 0.5
+            tests += 1
+        if tests == 0:
+            return best
+
+        # Grid heights are counted from the good end, 0, to the bad end, n.
+        n = 2 ** tests
+        h = span / float(n)
+
+        def height(k):
+            return lo + h * k if sign > 0 else lo + span - h * k
+
+        # a is the furthest height known to be good and b the nearest known
+        # to be bad, fa and fb f at them or None.
+        a, fa, b, fb = 0, ends[0], n, ends[1]
+        if seed is not None:
+            w = max(1, int(round(width / h)))
+            k = (seed - lo) / h if sign > 0 else (lo + span - seed) / h
+            k = int(min(max(round(k - w * 0.5), 1), n - 1))
+            fk = f(height(k))
+            if fk < 0:
+                # The boundary is nearer the good end.
+                b, fb = k, fk
+                while b > 1:
+                    k = max(b - w, 1)
+                    fk = f(height(k))
+                    if not fk < 0:
+                        a, fa = k, fk
+                        break
+                    b, fb = k, fk
+                    w *= 2
+            else:
+                a, fa = k, fk
+                while a < n - 1:
+                    k = min(a + w, n - 1)
+                    fk = f(height(k))
+                    if fk < 0:
+                        b, fb = k, fk
+                        break
+                    a, fa = k, fk
+                    w *= 2
+
+        side = 0
+        widths = []
+        while b - a > 1:
+            k = (a + b) // 2
+            usable = fa is not None and fb is not None and np.isfinite(fa) and np.isfinite(fb)
+            if secant and usable and (len(widths) < 2 or b - a <= 0.5 * widths[-2]):
+                k = int(round(a + (b - a) * fa / (fa - fb)))
+                k = min(max(k, a + 1), b - 1)
+            widths.append(b - a)
+
+            fk = f(height(k))
+            if fk < 0:
+                b, fb = k, fk
+                if side < 0 and fa is not None:
+                    fa *= 0.5
+                side = -1
+            else:
+                a, fa = k, fk
+                if side > 0 and fb is not None:
+                    fb *= 0.5
+                side = 1
+        return height(a) if a > 0 else best
+
+
+    def adaptiveMap(self, cableRes, gridRes, heightRes, minClearance, maxTension, weight, levels=4, tolerance=None,
+                    showProgress=False, chunkSize=2048, quadtree=False):
+        """Maps the limits of platform height as platformMap() does, on the
+        same grid, but solving only as much of it as needed.
+
+        The grid is first divided into squares 2 ** levels cells across.
+        The cells at the corners and centre of each square are solved, as
+        in platformMap(vectorized=True).  A square is split in four, to be
+        treated the same way, if it straddles an edge of the mast triangle,
+        if some of its solved cells have a solution and others don't, or if
+        the ceilings or floors solved in it differ by more than tolerance
+        (default 4 * heightRes).  The cells within a square that isn't split
+        are given the lowest ceiling and highest floor solved in it, so the
+        heights err on the safe side, by up to tolerance.  Only a bump in
+        the canopy between the solved cells can leave a floor too low.  So
+        only the feasibility boundary and where the surfaces slope or bend
+        are solved at full resolution.
+
+        On the synthetic terrain, at gridRes 5 and the default tolerance, no
+        floor came out below the full map's and the map took half the time
+        of platformMap(vectorized=True), mostly from skipping the cells
+        without a solution.  At gridRes 10 they took the same time and at 20
+        or coarser the full map is faster, so this only pays off for fine
+        grids.
+
+        Returns the same arrays as platformMap().  If quadtree is True they
+        are followed by an (N, 4) array giving the grid indices (yi0, xi0,
+        yi1, xi1) of the corners of the squares the map ended up divided
+        into.  Cells at the corners were solved, the rest interpolated.
+        """
+
+        def progress(ch):
+            '''display characters and flush to stdout immediately'''
+            if showProgress:
+                import sys
+                sys.stdout.write(ch)
+                sys.stdout.flush()
+
+        if tolerance is None:
+            tolerance = 4 * heightRes
+
+        xr, yr, xg, yg, cells = self._mapCells(gridRes)
+        shape = (yr.size, xr.size)
+
+        floorTen = np.ones(shape + (3,)) * np.NaN
+        ceilTen = np.ones(shape + (3,)) * np.NaN
+
+        zFloor = np.ones(shape) * np.NaN
+        zCeil = np.ones(shape) * np.NaN
+        zGround = np.ones(shape) * np.NaN
+
+        # The cells that need solving, with a summed area table of them to
+        # count those within any square.
+        inside = np.zeros(shape, dtype=bool)
+        inside.ravel()[cells] = True
+        counts = np.zeros((shape[0] + 1, shape[1] + 1), dtype=int)
+        counts[1:, 1:] = np.cumsum(np.cumsum(inside, axis=0), axis=1)
+
+        solved = np.zeros(shape, dtype=bool)
+
+        def solve(i, j):
+            '''solve the cells (i, j) which haven't been already'''
+            idx = np.unique(np.ravel_multi_index((i, j), shape))
+            idx = idx[~solved.ravel()[idx]]
+            solved.ravel()[idx] = True
+            idx = idx[inside.ravel()[idx]]
+            for start in range(0, idx.size, chunkSize):
+                sub = idx[start:start + chunkSize]
+                res = self._mapChunk(sub, xg[sub], yg[sub], cableRes, heightRes, minClearance, maxTension, weight)
+                sub, ceil, floor, ground, ften, cten = res[:6]
+                zCeil.ravel()[sub] = ceil
+                ceilTen.reshape(-1, 3)[sub] = cten
+                zGround.ravel()[sub] = ground
+                floorTen.reshape(-1, 3)[sub] = ften
+                zFloor.ravel()[sub] = floor
+            return idx.size
+
+        size = 2 ** levels
+        i0, j0 = [a.ravel() for a in np.meshgrid(np.arange(0, max(shape[0] - 1, 1), size),
+                                                 np.arange(0, max(shape[1] - 1, 1), size), indexing='ij')]
+        leaves = []
+        while i0.size:
+            i1 = np.minimum(i0 + size, shape[0] - 1)
+            j1 = np.minimum(j0 + size, shape[1] - 1)
+            ic = (i0 + i1) // 2
+            jc = (j0 + j1) // 2
+            n = solve(np.concatenate((i0, i0, i1, i1, ic)), np.concatenate((j0, j1, j0, j1, jc)))
+            progress('{:>5} cells apart: {} squares, {} cells solved\n'.format(size, i0.size, n))
+
+            # Split squares partly outside the triangle, ...
+            within = counts[i1 + 1, j1 + 1] - counts[i0, j1 + 1] - counts[i1 + 1, j0] + counts[i0, j0]
+            split = (within > 0) & (within < (i1 - i0 + 1) * (j1 - j0 + 1))
+
+            # ... where only some of the cells solved have a solution, ...
+            points = [(i0, j0), (i0, j1), (i1, j0), (i1, j1), (ic, jc)]
+            feasible = np.array([~np.isnan(zFloor[i, j]) for i, j in points])
+            split |= np.any(feasible, axis=0) & ~np.all(feasible, axis=0)
+
+            # ... and where the ceiling or floor vary by more than tolerance.
+            for z in (zCeil, zFloor):
+                solvedZ = np.array([z[i, j] for i, j in points])
+                with np.errstate(invalid='ignore'):
+                    split |= np.max(solvedZ, axis=0) - np.min(solvedZ, axis=0) > tolerance
+
+            # Squares a single cell across have nothing left to split.
+            split &= (i1 - i0 > 1) | (j1 - j0 > 1)
+
+            leaves.append(np.column_stack((i0, j0, i1, j1))[~split])
+
+            size //= 2
+            i0, j0, i1, j1 = [a[split] for a in (i0, j0, i1, j1)]
+            children = [(i0 + di, j0 + dj) for di in (0, size) for dj in (0, size)]
+            keep = [(i < i1) & (j < j1) for i, j in children]
+            i0 = np.concatenate([i[k] for (i, j), k in zip(children, keep)])
+            j0 = np.concatenate([j[k] for (i, j), k in zip(children, keep)])
+
+        leaves = np.concatenate(leaves)
+
+        # Fill in the cells within the squares whose corners all have a
+        # solution.  The heights are kept on the safe side: the highest floor
+        # and lowest ceiling solved in the square.  The tensions are
+        # interpolated from the corners.
+        for i0, j0, i1, j1 in leaves:
+            corners = np.ix_((i0, i1), (j0, j1))
+            if np.any(np.isnan(zFloor[corners])):
+                continue
+            square = (slice(i0, i1 + 1), slice(j0, j1 + 1))
+            fill = ~solved[square]
+            ic, jc = (i0 + i1) // 2, (j0 + j1) // 2
+            ceil = min(np.min(zCeil[corners]), zCeil[ic, jc])
+            floor = max(np.max(zFloor[corners]), zFloor[ic, jc])
+            if not floor <= ceil:
+                continue
+            zCeil[square][fill] = ceil
+            zFloor[square][fill] = floor
+
+            u = np.linspace(0, 1, i1 - i0 + 1)[:, np.newaxis, np.newaxis]
+            v = np.linspace(0, 1, j1 - j0 + 1)[np.newaxis, :, np.newaxis]
+            for z in (ceilTen, floorTen):
+                c = z[corners]
+                zi = (c[0, 0] * (1 - v) + c[0, 1] * v) * (1 - u) + (c[1, 0] * (1 - v) + c[1, 1] * v) * u
+                z[square][fill] = zi[fill]
+
+        # The ground is cheap to sample where it was interpolated.
+        filled = ~solved & ~np.isnan(zFloor)
+        zGround[filled] = self._sample(self.terrain.canopySurface, np.column_stack((xg.reshape(shape)[filled],
+                                                                                  yg.reshape(shape)[filled])))
+
+        progress('{} of {} cells solved\n'.format(np.sum(solved & inside), cells.size))
+
+        if quadtree:
+            return xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen, leaves
         return xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen
 
+
+
+    def heightCurves(self, gridRes, weights, samples=32, cableRes=None, chunkSize=2048):
+        """Tabulates the mast tensions against platform height at each cell of
+        the map grid, for each of the given weights.
+
+        The heights are spread evenly from the canopy up towards the ceiling
+        plane, samples of them.  Returns a HeightCurves, from which the
+        ceiling for any maxTension, and any weight between the smallest and
+        largest of weights, is then found without solving for the cables
+        again.
+
+        If cableRes is given the least clearance between the cables and the
+        canopy, checked at that interval along the cables, is tabulated too.
+        Then the whole map for any minClearance can be found as well.
+        """
+        xr, yr, xg, yg, cells = self._mapCells(gridRes)
+        x, y = xg[cells], yg[cells]
+
+        ceiling = self.tcs.ceilK[0] * x + self.tcs.ceilK[1] * y + self.tcs.ceilK[2]
+        floor = self._sample(self.terrain.canopySurface, np.column_stack((x, y)))
+
+        # Drop points where the canopy extends up above the ceiling
+        keep = ceiling - floor >= 0
+        cells, x, y, ceiling, floor = [v[keep] for v in (cells, x, y, ceiling, floor)]
+
+        z = floor[:, np.newaxis] + (ceiling - floor)[:, np.newaxis] * np.arange(samples) / float(samples)
+
+        weights = np.sort(np.atleast_1d(np.array(weights, dtype=float)))
+        tension = np.ones((weights.size,) + z.shape + (3,)) * np.NaN
+        clearance = None
+        planeClearance = None
+        if cableRes is not None:
+            clearance = np.ones((weights.size,) + z.shape) * np.NaN
+            planeClearance = np.ones(len(cells)) * np.NaN
+
+        # Whole cells at a time, so the terrain beneath the cables is found
+        # once for all the heights.
+        p = np.array(self.tcs.p, dtype=float)
+        step = max(1, chunkSize // samples)
+        for start in range(0, len(cells), step):
+            sel = slice(start, start + step)
+            n = len(x[sel])
+            xs, ys, zs = np.repeat(x[sel], samples), np.repeat(y[sel], samples), z[sel].ravel()
+
+            if cableRes is not None:
+                d, zt = self._terrainBeneathCells(x[sel], y[sel], cableRes)
+                # At the ceiling plane the cables are straight.
+                w = np.max(d, axis=2)[:, :, np.newaxis]
+                chord = p[:, 2, np.newaxis] + (ceiling[sel, np.newaxis, np.newaxis] - p[:, 2, np.newaxis]) * d / w
+                planeClearance[sel] = np.min((chord - zt).reshape(n, -1), axis=1)
+                d, zt = np.repeat(d, samples, axis=0), np.repeat(zt, samples, axis=0)
+
+            for i, weight in enumerate(weights):
+                c, t, okay = self._tuneCells(xs, ys, zs, weight)
+                t[~okay] = np.NaN
+                tension[i, sel] = t.reshape(n, samples, 3)
+                if cableRes is not None:
+                    with np.errstate(over='ignore', invalid='ignore'):
+                        zcab = c.cableZ(d)
+                    mc = np.min((zcab - zt).reshape(len(zcab), -1), axis=1)
+                    mc[~okay] = np.NaN
+                    clearance[i, sel] = mc.reshape(n, samples)
+
+        return HeightCurves(xr, yr, cells, floor, ceiling, z, weights, tension, clearance, planeClearance)
+
+
+
+    def workspaceTable(self, gridRes, heights, weights, cableRes=10, chunkSize=2048):
+        """Tabulates the mast tensions, cable lengths and least clearance over
+        the canopy with the platform at each of the heights above the ground
+        at each point of a grid over the masts' bounding box, gridRes apart,
+        for each of the weights.
+
+        Returns a WorkspaceTable, which interpolates them for any position
+        and weight within the table far faster than solving the cables, for
+        instance to follow interactive controls.  The clearance is checked
+        along the cables every cableRes.
+        """
+        xr, yr = self._mapGrid(gridRes)[:2]
+        x, y = [a.ravel() for a in np.meshgrid(xr, yr)]
+        heights = np.array(heights, dtype=float)
+        weights = np.sort(np.atleast_1d(np.array(weights, dtype=float)))
+        ground = self._sample(self.terrain.groundSurface, np.column_stack((x, y)))
+
+        shape = (weights.size, x.size, heights.size, 3)
+        tension = np.ones(shape) * np.NaN
+        length = np.ones(shape) * np.NaN
+        clearance = np.ones(shape) * np.NaN
+
+        # Whole grid points at a time, so the terrain beneath the cables is
+        # found once for all the heights.
+        step = max(1, chunkSize // heights.size)
+        for start in range(0, x.size, step):
+            sel = slice(start, start + step)
+            n = len(x[sel])
+            xs, ys = np.repeat(x[sel], heights.size), np.repeat(y[sel], heights.size)
+            zs = (ground[sel, np.newaxis] + heights).ravel()
+
+            d, zt = self._terrainBeneathCells(x[sel], y[sel], cableRes)
+            d, zt = np.repeat(d, heights.size, axis=0), np.repeat(zt, heights.size, axis=0)
+
+            for i, weight in enumerate(weights):
+                with np.errstate(all='ignore'):
+                    c, t, okay = self._tuneCells(xs, ys, zs, weight)
+                    lengths = c.length()
+                    mc = np.min(c.cableZ(d) - zt, axis=2)
+                t[~okay] = lengths[~okay] = mc[~okay] = np.NaN
+                tension[i, sel] = t.reshape(n, heights.size, 3)
+                length[i, sel] = lengths.reshape(n, heights.size, 3)
+                clearance[i, sel] = mc.reshape(n, heights.size, 3)
+
+        grid = (weights.size, yr.size, xr.size, heights.size, 3)
+        return WorkspaceTable(xr, yr, heights, weights, tension.reshape(grid), length.reshape(grid),
+                              clearance.reshape(grid))
+
+
+    def _mapGrid(self, gridRes):
+        # Returns the x and y ranges of the horizontal grid to map over, and a
+        # path used to determine if a point is within the mast defined triangle.
+        import matplotlib.path as mplp
+
+        def roundRange(vals, res):
+            '''returns a vector of
+
+            The vector has values uniformly spaced by res.  The range is from
+            below the minimum value in vals to just above it.
+            '''
+            start = np.floor(np.min(vals) / res) * res
+            end = np.ceil(np.max(vals) / res) * res
+            return np.arange(start, end + res / 2, res)
+
+        # Set the horizontal grid we will map over - it covers the whole range.
+        xr = roundRange([self.tcs.p[i][0] for i in range(3)], gridRes)
+        yr = roundRange([self.tcs.p[i][1] for i in range(3)], gridRes)
+
+        # establish what is inside the triangle and what's not
+        bp = np.array([[self.tcs.p[i][j] for j in range(2)] for i in range(3)])
+        bounds = mplp.Path(bp, np.array([1, 2, 2], dtype='uint8'), closed=True)
+
+        return xr, yr, bounds
+
+
+    def _mapCells(self, gridRes):
+        # Returns the grid ranges and the flat indices of the grid cells that
+        # need solving: inside the mast triangle but not right at a mast.
+        xr, yr, x, y, cellStatus = self._mapStatus(gridRes)
+        return xr, yr, x, y, np.flatnonzero(cellStatus.ravel() == CellStatus.UNSOLVED)
+
+
+    def _mapStatus(self, gridRes):
+        # Returns the grid ranges, the flattened x and y of every grid cell
+        # and the status array of a map not yet solved: cells outside the
+        # mast triangle or right at a mast are marked so, the rest UNSOLVED.
+        xr, yr, bounds = self._mapGrid(gridRes)
+
+        x, y = [a.ravel() for a in np.meshgrid(xr, yr)]
+        inside = bounds.contains_points(np.column_stack((x, y)))
+        atMast = np.zeros(x.shape, dtype=bool)
+        for i in range(3):
+            atMast |= (x == self.tcs.p[i][0]) & (y == self.tcs.p[i][1])
+
+        cellStatus = np.ones(x.shape, dtype=np.int8) * CellStatus.OUTSIDE
+        cellStatus[inside & atMast] = CellStatus.AT_MAST
+        cellStatus[inside & ~atMast] = CellStatus.UNSOLVED
+        return xr, yr, x, y, cellStatus.reshape(yr.size, xr.size)
+
+
+    def _tuneCells(self, x, y, z, weight):
+        # Balances the platform at each of the positions (x, y, z).  Returns
+        # the cables as a CableArray, the tension at each mast and a mask of
+        # the positions where all cables are in tension.
+        with self.stats.timer('tuneMany'):
+            th, ten, lengths, okay = self.tcs.tuneMany(np.column_stack((x, y, z)), weight)
+        self.stats.count('tunedPositions', len(x))
+        self.stats.count('catenaryEvaluations', self.tcs.evaluations)
+        return self.tcs.cables, ten, okay
+
+
+    def _terrainBeneathCells(self, x, y, resolution):
+        # Array counterpart of getTerrainBeneathCables() for M platform
+        # positions.  Samples are padded out to the longest cable, the padding
+        # is given a canopy height of -inf so it never limits clearance.
+        p = np.array(self.tcs.p, dtype=float)
+        w = np.sqrt(np.square(x[:, np.newaxis] - p[:, 0]) + np.square(y[:, np.newaxis] - p[:, 1]))
+        numPoints = np.array(np.ceil(w / resolution), dtype=int)
+
+        j = np.arange(np.max(numPoints) if numPoints.size else 0)
+        t = j / np.maximum(numPoints - 1, 1)[:, :, np.newaxis].astype(float)
+        valid = j < numPoints[:, :, np.newaxis]
+        t = np.minimum(t, 1)
+
+        d = t * w[:, :, np.newaxis]
+        zt = np.empty(d.shape)
+
+        # Take what the profile tables cover from them and sample the rest
+        direct = np.ones(w.shape, dtype=bool)
+        if self.polarRes:
+            for i, prof in enumerate(self.getProfiles()):
+                bearing = prof.relativeBearing(x - p[i, 0], y - p[i, 1])
+                covered = prof.covers(bearing, w[:, i])
+                zt[covered, i] = prof.sample(prof.canopy, bearing[covered, np.newaxis], d[covered, i])
+                direct[:, i] = ~covered
+
+        if np.any(direct):
+            t = t[direct]
+            xd = np.broadcast_to(x[:, np.newaxis], w.shape)[direct]
+            yd = np.broadcast_to(y[:, np.newaxis], w.shape)[direct]
+            px, py = [np.broadcast_to(p[:, k], w.shape)[direct] for k in (0, 1)]
+            sx = px[:, np.newaxis] + t * (xd - px)[:, np.newaxis]
+            sy = py[:, np.newaxis] + t * (yd - py)[:, np.newaxis]
+            zt[direct] = self._sample(self.terrain.canopySurface,
+                                      np.column_stack((sx.ravel(), sy.ravel()))).reshape(t.shape)
+
+        zt[~valid] = -np.inf
+
+        return d, zt
+
+
+    def _platformMapVectorized(self, cableRes, gridRes, heightRes, minClearance, maxTension, weight, progress,
+                               chunkSize, processes, monitor, checkpoint=None):
+        # Whole grid version of platformMap().  The cells are split into
+        # chunks of whole rows which are solved by _mapChunk(), either here
+        # or on a pool of worker processes, see MapStream.
+        stream = self.streamMap(cableRes, gridRes, heightRes, minClearance, maxTension, weight, chunkSize,
+                                processes, checkpoint, monitor)
+        progress('{} cells in {} chunks\n'.format(stream.cells, len(stream.chunks)))
+        for rows in stream:
+            progress('.')
+        progress('\n')
+
+        return stream.result()
+
+
+    def streamMap(self, cableRes, gridRes, heightRes, minClearance, maxTension, weight, chunkSize=2048,
+                  processes=1, checkpoint=None, monitor=None):
+        """Returns a MapStream, an iterator over the map platformMap() would
+        make, solved as in platformMap(vectorized=True).
+
+        Iterating over it yields the map a chunk of whole grid rows at a
+        time, as each is solved, so the map can be shown or saved as it
+        grows.  Each is (rows, zCeil, zFloor, zGround, floorTen, ceilTen,
+        status) where rows is a slice of the grid rows and the rest are
+        those rows of the map.  The map so far is kept in the stream's
+        attributes of the same names and returned by its result().
+
+        checkpoint is a mapCache.MapCheckpoint, or a directory for one, to
+        keep the chunks in as they're solved.  Chunks of the same map
+        already kept there, from a run that was interrupted, are yielded
+        first and not solved again.  Once the last chunk has been yielded
+        they're deleted.  monitor is as for platformMap().
+        """
+        if checkpoint is not None and not isinstance(checkpoint, mapCache.MapCheckpoint):
+            checkpoint = mapCache.MapCheckpoint(checkpoint, self, gridRes, chunkSize, cableRes, heightRes,
+                                                minClearance, maxTension, weight)
+        return MapStream(self, gridRes, (cableRes, heightRes, minClearance, maxTension, weight), chunkSize,
+                         processes, checkpoint, instrumentation.progressMonitor(monitor))
+
+
+    def _shareTerrain(self):
+        # Returns what the map workers need to recreate the terrain.  Where
+        # the terrain supports it the layers go in shared memory, otherwise
+        # the terrain is passed as is and must be picklable.
+        if hasattr(self.terrain, 'share'):
+            return self.terrain.share()
+        return self.terrain
+
+
+    def _mapChunk(self, idx, x, y, cableRes, heightRes, minClearance, maxTension, weight):
+        # Solves the map cells with flat indices idx at positions (x, y),
+        # following the same steps as the scalar loop in platformMap() but
+        # for arrays of cells.  Returns the indices of the cells which have a
+        # solution along with their ceiling, floor and ground heights and the
+        # floor and ceiling cable tensions, then the CellStatus of every cell
+        # of idx.
+        self.stats.count('cells', len(idx))
+        tuned = self.stats.counts.get('tunedPositions', 0)
+        cellStatus = np.ones(len(idx), dtype=np.int8) * CellStatus.OK
+        rank = np.arange(len(idx))
+
+        def clearance(sel, c, d, zt):
+            with np.errstate(over='ignore', invalid='ignore'):
+                zcab = c.cableZ(d[sel])
+            return np.min((zcab - zt[sel]).reshape(len(zcab), -1), axis=1)
+
+        # For each point determine the max height (with infinite tension)
+        # and the height above the canopy below.
+        ceiling = self.tcs.ceilK[0] * x + self.tcs.ceilK[1] * y + self.tcs.ceilK[2]
+        floor = self._sample(self.terrain.canopySurface, np.column_stack((x, y)))
+
+        clear = ceiling - floor
+
+        # Drop points where the canopy extends up above the ceiling
+        keep = clear >= 0
+        cellStatus[~keep] = CellStatus.CANOPY_ABOVE_CEILING
+        rank, x, y, ceiling, floor, clear = [v[keep] for v in (rank, x, y, ceiling, floor, clear)]
+        if not keep.any():
+            none = np.zeros(0)
+            return idx[:0], none, none, none, np.zeros((0, 3)), np.zeros((0, 3)), cellStatus
+
+        failed = np.zeros(len(x), dtype=np.int8)
+
+        def check(okay, sel, c):
+            # Note the cells sel which couldn't be balanced, telling those
+            # needing a cable in compression from the rest.
+            bad = ~okay
+            if np.any(bad):
+                failed[sel[bad]] = np.where(np.any(c.th[bad] <= 0, axis=1), CellStatus.COMPRESSION,
+                                            CellStatus.SOLVER_FAILURE)
+
+        # Find the maxTension ceiling.
+        step = clear * 0.5
+        z = floor + step
+        c, ten, okay = self._tuneCells(x, y, z, weight)
+        check(okay, np.arange(len(x)), c)
+
+        lastGoodZ = z.copy()
+        lastGoodTen = ten.copy()
+        active = (step > heightRes) & (failed == 0)
+        while np.any(active):
+            sel = np.flatnonzero(active)
+            step[sel] *= 0.5
+
+            over = np.max(ten[sel], axis=1) > maxTension
+            # Tension required for this height is too great, lower the platform.
+            z[sel[over]] -= step[sel[over]]
+            good = sel[~over]
+            lastGoodZ[good] = z[good]
+            lastGoodTen[good] = ten[good]
+            z[good] += step[good]
+
+            c, ten[sel], okay = self._tuneCells(x[sel], y[sel], z[sel], weight)
+            check(okay, sel, c)
+
+            active = (step > heightRes) & (failed == 0)
+
+        z = lastGoodZ.copy()
+        c, ten, okay = self._tuneCells(x, y, z, weight)
+        check(okay, np.arange(len(x)), c)
+
+        d, zt = self._terrainBeneathCells(x, y, cableRes)
+        mc = clearance(slice(None), c, d, zt)
+
+        # Drop points which couldn't be balanced and those where even at
+        # maximum tension we can't ensure clearance of all cables.
+        cellStatus[rank[failed != 0]] = failed[failed != 0]
+        noClearance = ~(mc >= minClearance) & (failed == 0)
+        cellStatus[rank[noClearance]] = CellStatus.NO_CLEARANCE
+        keep = (mc >= minClearance) & (failed == 0)
+        rank, x, y, floor, lastGoodZ, lastGoodTen, d, zt = \
+            [v[keep] for v in (rank, x, y, floor, lastGoodZ, lastGoodTen, d, zt)]
+
+        clearance0 = lastGoodZ - floor
+        failed = np.where(clearance0 < 0, CellStatus.SOLVER_FAILURE, 0).astype(np.int8)
+
+        # Find the minClearance floor, starting from the ceiling.
+        floorZ = lastGoodZ.copy()
+        floorT = lastGoodTen.copy()
+        step = clearance0 * 0.5
+        z = floor + step
+        active = (step > heightRes) & (failed == 0)
+        while np.any(active):
+            sel = np.flatnonzero(active)
+            step[sel] *= 0.5
+
+            c, ten, okay = self._tuneCells(x[sel], y[sel], z[sel], weight)
+            check(okay, sel, c)
+            mc = clearance(sel, c, d, zt)
+
+            # we need to raise the platform
+            low = ~(mc >= minClearance)
+            z[sel[low]] += step[sel[low]]
+            good = sel[~low]
+            floorZ[good] = z[good]
+            floorT[good] = ten[~low]
+            z[good] -= step[good]
+
+            active = (step > heightRes) & (failed == 0)
+
+        cellStatus[rank[failed != 0]] = failed[failed != 0]
+        keep = failed == 0
+        self.stats.count('balances', self.stats.counts['tunedPositions'] - tuned)
+        return (idx[rank[keep]], lastGoodZ[keep], floorZ[keep], floor[keep], floorT[keep], lastGoodTen[keep],
+                cellStatus)
+
+
+def rowChunks(cells, rowLength, chunkSize):
+    # Splits the sorted flat grid indices cells into a list of chunks of
+    # whole rows, each of roughly chunkSize cells (at least one row).
+    rows = cells // rowLength
+    bounds = np.flatnonzero(np.diff(rows)) + 1
+    starts = np.concatenate(([0], bounds))
+    chunks = []
+    first = 0
+    for start in list(starts[1:]) + [cells.size]:
+        if start - first >= chunkSize or start == cells.size:
+            if start > first:
+                chunks.append(cells[first:start])
+            first = start
+    return chunks
+
+
+# State held by each platformMap worker process
+_mapWorker = dict()
+
+
+def _initMapWorker(terrainSpec, tcs, polarRes, profiles):
+    import terrain
+    if isinstance(terrainSpec, terrain.SharedTerrain):
+        terrainSpec = terrainSpec.attach()
+    itcs = InstalledTCS(terrainSpec)
+    itcs.tcs = tcs
+    if polarRes:
+        itcs.usePolarProfiles(*polarRes)
+        itcs.profiles = profiles
+        itcs.profileMasts = np.array([[tcs.p[i][0], tcs.p[i][1]] for i in range(3)])
+    _mapWorker['itcs'] = itcs
+
+
+def _mapChunkWorker(args):
+    # Returns the cells of the chunk, its solution and the stats of solving
+    # it.
+    itcs = _mapWorker['itcs']
+    itcs.stats.reset()
+    return args[0], itcs._mapChunk(*args), itcs.stats
+
+
+
+class PolarProfile:
+    # Canopy and ground heights sampled on a polar (bearing x range) grid
+    # centred on a mast.  Every cable from the mast runs radially, so the
+    # terrain beneath any of them is an interpolation in this table rather
+    # than a new lookup in the terrain raster.
+    #
+    # The table covers bearings from lo to hi (radians anticlockwise from the
+    # x axis) out to maxRange, at spacings of bearingRes and rangeRes.
+
+    def __init__(self, terrain, centre, lo, hi, maxRange, rangeRes, bearingRes):
+        self.centre = np.array(centre, dtype=float)
+        self.lo = lo
+        self.span = hi - lo
+        numBearings = int(max(np.ceil(self.span / bearingRes), 1)) + 1
+        self.bearingRes = self.span / (numBearings - 1)
+        self.rangeRes = rangeRes
+
+        bearings = lo + np.arange(numBearings) * self.bearingRes
+        ranges = np.arange(np.ceil(maxRange / rangeRes) + 1) * rangeRes
+        self.maxRange = ranges[-1]
+
+        x = self.centre[0] + np.outer(np.cos(bearings), ranges)
+        y = self.centre[1] + np.outer(np.sin(bearings), ranges)
+        loc = np.column_stack((x.ravel(), y.ravel()))
+        self.canopy = terrain.canopySurface(loc).reshape(x.shape)
+        self.ground = terrain.groundSurface(loc).reshape(x.shape)
+
+
+    def relativeBearing(self, dx, dy):
+        # Returns the bearing of the offset (dx, dy) from the centre, relative
+        # to the start of the table.
+        return np.mod(np.arctan2(dy, dx) - self.lo, 2 * np.pi)
+
+
+    def covers(self, bearing, d):
+        # Returns True where the table covers a cable out to distance d along
+        # the relative bearing.
+        return (bearing <= self.span) & (d <= self.maxRange)
+
+
+    def sample(self, layer, bearing, d):
+        # Returns heights from layer (canopy or ground) at distances d along
+        # relative bearings, interpolated bilinearly.
+        bearing, d = np.broadcast_arrays(bearing, d)
+        coords = np.array([bearing.ravel() / self.bearingRes, d.ravel() / self.rangeRes])
+        z = scipy.ndimage.map_coordinates(layer, coords, order=1, mode='nearest')
+        return z.reshape(d.shape)
+
+
+class HeightCurves:
+    # Mast tensions, and optionally cable clearances, sampled against
+    # platform height at each solvable cell of a map grid, as made by
+    # InstalledTCS.heightCurves().  cells are the flat indices of the cells
+    # in the grid xr, yr.  z holds the heights sampled at each cell, from its
+    # floor (the canopy) up towards its ceiling plane, and tension and
+    # clearance their values there for each of the weights.  planeClearance
+    # is the clearance with the platform at the ceiling plane.
+    #
+    # Near the ceiling plane the tension grows as 1 / (ceiling - z), so the
+    # reciprocals of the tensions are interpolated between heights, which
+    # also puts the ceiling plane itself on the curve at a reciprocal of 0.
+
+    def __init__(self, xr, yr, cells, floor, ceiling, z, weights, tension, clearance=None,
+                 planeClearance=None):
+        self.xr = xr
+        self.yr = yr
+        self.cells = cells
+        self.floor = floor
+        self.ceiling = ceiling
+        self.z = z
+        self.weights = weights
+        self.tension = tension
+        self.clearance = clearance
+        self.planeClearance = planeClearance
+
+
+    def atWeight(self, table, weight=None):
+        # Returns the table (tension or clearance) for weight, interpolated
+        # linearly between the weights tabulated.  Only the one weight needs
+        # giving if only one was tabulated.
+        if weight is None:
+            if self.weights.size != 1:
+                raise ValueError('weight needed, curves have {} weights'.format(self.weights.size))
+            return table[0]
+        if not self.weights[0] <= weight <= self.weights[-1]:
+            raise ValueError('weight outside the range tabulated', weight, self.weights)
+        i = min(np.searchsorted(self.weights, weight, side='right'), self.weights.size - 1)
+        if self.weights[i] == weight or i == 0:
+            return table[i]
+        t = (weight - self.weights[i - 1]) / (self.weights[i] - self.weights[i - 1])
+        return table[i - 1] * (1 - t) + table[i] * t
+
+
+    def tensionCurves(self, weight=None):
+        # Returns the tensions sampled at each cell for weight.
+        return self.atWeight(self.tension, weight)
+
+
+    def grid(self, values):
+        # Returns values for each of the cells spread out over the map grid,
+        # NaN where there is no cell.
+        out = np.ones((self.yr.size * self.xr.size,) + values.shape[1:]) * np.NaN
+        out[self.cells] = values
+        return out.reshape((self.yr.size, self.xr.size) + values.shape[1:])
+
+
+    def heights(self):
+        # Returns the heights sampled at each cell with the ceiling plane
+        # after them.
+        return np.column_stack((self.z, self.ceiling))
+
+
+    def reciprocals(self, weight=None):
+        # Returns the reciprocal tensions at the heights(), 0 at the plane.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recip = 1.0 / self.tensionCurves(weight)
+        return np.concatenate((recip, np.zeros((len(self.cells), 1, 3))), axis=1)
+
+
+    def interpolate(self, values, z, zq):
+        # Returns values, sampled at heights z for each cell, interpolated
+        # linearly to the height zq at each cell.  With zq NaN so is the
+        # result.
+        n = len(self.cells)
+        k = np.clip(np.sum(z <= zq[:, np.newaxis], axis=1) - 1, 0, z.shape[1] - 2)
+        rows = np.arange(n)
+        t = (zq - z[rows, k]) / (z[rows, k + 1] - z[rows, k])
+        if values.ndim == 3:
+            t = t[:, np.newaxis]
+        return values[rows, k] * (1 - t) + values[rows, k + 1] * t
+
+
+    def ceilings(self, maxTension, weight=None):
+        # Flat version of ceilingFor(), for the cells.
+        recip = self.reciprocals(weight)
+        z = self.heights()
+        n = len(self.cells)
+
+        # The first height sampled that needs too much tension, and the one
+        # below it.
+        good = np.min(recip, axis=2) >= 1.0 / maxTension
+        hi = np.argmin(good, axis=1)
+        found = hi > 0
+        rows = np.flatnonzero(found)
+        hi = hi[found]
+        lo = hi - 1
+
+        rLo, rHi = np.min(recip[rows, lo], axis=1), np.min(recip[rows, hi], axis=1)
+        t = (rLo - 1.0 / maxTension) / (rLo - rHi)
+
+        zCeil = np.ones(n) * np.NaN
+        zCeil[rows] = z[rows, lo] + t * (z[rows, hi] - z[rows, lo])
+        return zCeil, self.tensionsAt(recip, zCeil)
+
+
+    def tensionsAt(self, recip, zq):
+        # Returns the tensions at height zq for each cell, from their
+        # reciprocals at the heights().
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 1.0 / self.interpolate(recip, self.heights(), zq)
+
+
+    def ceilingFor(self, maxTension, weight=None):
+        # Returns maps of the highest platform height where no mast tension
+        # exceeds maxTension, and the tensions there, as the zCeil and ceilTen
+        # of platformMap().  Cells where even the canopy height needs more
+        # tension are NaN.
+        zCeil, ceilTen = self.ceilings(maxTension, weight)
+        return self.grid(zCeil), self.grid(ceilTen)
+
+
+    def mapFor(self, minClearance, maxTension, weight=None):
+        # Returns the same arrays as platformMap() for the given limits and
+        # weight, found from the curves.  Needs the clearances tabulated.
+        if self.clearance is None:
+            raise ValueError('clearance not tabulated, give heightCurves() a cableRes')
+
+        zCeil, ceilTen = self.ceilings(maxTension, weight)
+        z = self.heights()
+        clear = np.column_stack((self.atWeight(self.clearance, weight), self.planeClearance))
+
+        # Drop cells where even at maximum tension the cables can't clear the
+        # canopy.
+        with np.errstate(invalid='ignore'):
+            feasible = self.interpolate(clear, z, zCeil) >= minClearance
+        zCeil[~feasible] = np.NaN
+        ceilTen[~feasible] = np.NaN
+
+        # The floor is where the clearance crosses minClearance above the
+        # highest height sampled below the ceiling that doesn't clear.
+        with np.errstate(invalid='ignore'):
+            low = ~(clear >= minClearance) & (z < zCeil[:, np.newaxis])
+        k = z.shape[1] - 1 - np.argmax(low[:, ::-1], axis=1)
+        rows = np.arange(len(self.cells))
+        k = np.minimum(k, z.shape[1] - 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (minClearance - clear[rows, k]) / (clear[rows, k + 1] - clear[rows, k])
+            zFloor = np.minimum(z[rows, k] + t * (z[rows, k + 1] - z[rows, k]), zCeil)
+        zFloor[~np.any(low, axis=1)] = self.floor[~np.any(low, axis=1)]
+        zFloor[~feasible] = np.NaN
+
+        floorTen = self.tensionsAt(self.reciprocals(weight), zFloor)
+        zGround = np.where(feasible, self.floor, np.NaN)
+
+        return (self.xr, self.yr, self.grid(zCeil), self.grid(zFloor), self.grid(zGround), self.grid(floorTen),
+                self.grid(ceilTen))
+
+
+class CellStatus:
+    # The status of each cell of a map, see platformMap(status=True).
+    OK = 0                      # solved
+    OUTSIDE = 1                 # outside the mast triangle
+    AT_MAST = 2                 # right at a mast
+    CANOPY_ABOVE_CEILING = 3    # the canopy reaches above the ceiling plane
+    COMPRESSION = 4             # a cable would have to push
+    SOLVER_FAILURE = 5          # the platform couldn't be balanced
+    NO_CLEARANCE = 6            # the cables can't clear the canopy by minClearance
+    UNSOLVED = 7                # not yet attempted
+
+    names = ['ok', 'outside', 'at mast', 'canopy above ceiling', 'compression', 'solver failure', 'no clearance',
+             'unsolved']
+
+
+
+class CellError(RuntimeError):
+    # Raised within the platformMap() scalar loop when a cell can't be solved.
+    # status is the CellStatus code for it.
+
+    def __init__(self, status, *args):
+        RuntimeError.__init__(self, *args)
+        self.status = status
+
+
+
+class MapStream:
+    # A map being solved a chunk of whole grid rows at a time, as returned by
+    # InstalledTCS.streamMap().  The map so far is in xr, yr, zCeil, zFloor,
+    # zGround, floorTen, ceilTen and status, cells not yet solved being NaN
+    # and UNSOLVED.
+
+    def __init__(self, itcs, gridRes, params, chunkSize, processes, checkpoint, monitor):
+        self.itcs = itcs
+        self.params = params
+        self.processes = processes
+        self.checkpoint = checkpoint
+        self.monitor = monitor
+
+        self.xr, self.yr, self.xg, self.yg, self.status = itcs._mapStatus(gridRes)
+        shape = (self.yr.size, self.xr.size)
+        cells = np.flatnonzero(self.status.ravel() == CellStatus.UNSOLVED)
+        self.cells = cells.size
+        self.chunks = rowChunks(cells, self.xr.size, chunkSize)
+
+        self.floorTen = np.ones(shape + (3,)) * np.NaN
+        self.ceilTen = np.ones(shape + (3,)) * np.NaN
+        self.zFloor = np.ones(shape) * np.NaN
+        self.zCeil = np.ones(shape) * np.NaN
+        self.zGround = np.ones(shape) * np.NaN
+
+
+    def __iter__(self):
+        self.monitor.start(self.cells)
+
+        # Chunks kept from before first, then the rest as they're solved
+        pending = []
+        for chunk in self.chunks:
+            res = self.checkpoint.load(chunk) if self.checkpoint is not None else None
+            if res is None:
+                pending.append(chunk)
+            else:
+                yield self.store(chunk, res)
+
+        for chunk, res in self.solve(pending):
+            if self.checkpoint is not None:
+                self.checkpoint.save(chunk, res)
+            yield self.store(chunk, res)
+
+        # The whole map is here now, so the chunks kept are no longer needed
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+        self.monitor.finish()
+
+
+    def solve(self, chunks):
+        # Yields each of chunks with its solution, solved here or on a pool
+        # of worker processes.
+        itcs = self.itcs
+        if self.processes == 1:
+            for idx in chunks:
+                yield idx, itcs._mapChunk(idx, self.xg[idx], self.yg[idx], *self.params)
+            return
+
+        import multiprocessing
+        profiles = itcs.getProfiles() if itcs.polarRes else None
+        pool = multiprocessing.Pool(self.processes, initializer=_initMapWorker,
+                                    initargs=(itcs._shareTerrain(), itcs.tcs, itcs.polarRes, profiles))
+        try:
+            jobs = [(idx, self.xg[idx], self.yg[idx]) + self.params for idx in chunks]
+            for chunk, res, stats in pool.imap_unordered(_mapChunkWorker, jobs):
+                itcs.stats.merge(stats)
+                yield chunk, res
+            pool.close()
+        except:
+            # Including the stream being abandoned part way
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
+    def store(self, chunk, res):
+        # Puts the solution of a chunk in the map, returning its rows.
+        idx, ceil, floor, ground, ften, cten, chunkStatus = res
+        self.status.ravel()[chunk] = chunkStatus
+        self.zCeil.ravel()[idx] = ceil
+        self.ceilTen.reshape(-1, 3)[idx] = cten
+        self.zGround.ravel()[idx] = ground
+        self.floorTen.reshape(-1, 3)[idx] = ften
+        self.zFloor.ravel()[idx] = floor
+        self.monitor.update(len(chunk))
+
+        rows = slice(chunk[0] // self.xr.size, chunk[-1] // self.xr.size + 1)
+        return (rows, self.zCeil[rows], self.zFloor[rows], self.zGround[rows], self.floorTen[rows],
+                self.ceilTen[rows], self.status[rows])
+
+
+    def result(self):
+        # Returns the map so far, as platformMap(status=True) does.
+        return (self.xr, self.yr, self.zCeil, self.zFloor, self.zGround, self.floorTen, self.ceilTen,
+                self.status)
+
+
+    def run(self):
+        # Solves the rest of the map, returning it as result() does.
+        for rows in self:
+            pass
+        return self.result()
+
+
+
+class WorkspaceTable:
+    # Mast tensions, cable lengths and the least clearance of each cable over
+    # the canopy, tabulated over a grid of platform positions (x, y and
+    # height above the ground) and weights, as made by
+    # InstalledTCS.workspaceTable().  The tables are indexed [weight, y, x,
+    # height, cable] and are NaN where a cable would be in compression.
+    #
+    # As in HeightCurves the reciprocals of the tensions are interpolated,
+    # they're near linear in height where the tensions themselves grow
+    # without bound.
+
+    def __init__(self, xr, yr, heights, weights, tension, length, clearance):
+        self.xr = xr
+        self.yr = yr
+        self.heights = heights
+        self.weights = weights
+        self.tension = tension
+        self.length = length
+        self.clearance = clearance
+        with np.errstate(divide='ignore'):
+            self.reciprocal = 1.0 / tension
+
+
+    def coordinates(self, x, y, height, weight):
+        # Returns the fractional table indices of the positions and weights,
+        # which may be arrays.  Those outside the table are NaN.
+        def index(v, axis):
+            if axis.size == 1:
+                return np.where(v == axis[0], 0.0, np.NaN)
+            return np.interp(v, axis, np.arange(axis.size), left=np.NaN, right=np.NaN)
+
+        x, y, height, weight = np.broadcast_arrays(*[np.array(v, dtype=float) for v in (x, y, height, weight)])
+        return np.array([index(weight, self.weights), index(y, self.yr), index(x, self.xr),
+                         index(height, self.heights)])
+
+
+    def lookup(self, x, y, height, weight):
+        # Returns the tension and length of each cable and the least
+        # clearance of any cable over the canopy with the platform, carrying
+        # weight, at height above the ground at (x, y).  Each may be an array,
+        # the results then have their shape, with a last axis of the three
+        # cables for tension and length.  Positions next to one where a cable
+        # would be in compression, or outside the table, are NaN.
+        coords = self.coordinates(x, y, height, weight)
+        shape = coords.shape[1:]
+        coords = coords.reshape(4, -1)
+        outside = np.any(np.isnan(coords), axis=0)
+        coords[:, outside] = 0
+
+        def sample(table):
+            z = np.column_stack([scipy.ndimage.map_coordinates(table[..., i], coords, order=1, mode='nearest')
+                                 for i in range(3)])
+            z[outside] = np.NaN
+            return z
+
+        with np.errstate(divide='ignore'):
+            tension = 1.0 / sample(self.reciprocal)
+        length = sample(self.length)
+        clearance = np.min(sample(self.clearance), axis=1)
+        return tension.reshape(shape + (3,)), length.reshape(shape + (3,)), clearance.reshape(shape)
@@ -0,0 +1,210 @@
+import sys
+import timeit
+
+
+class SolverStats:
+    # Counters and cumulative timers of the work done by an InstalledTCS, kept
+    # as its stats.  counts and times are dicts keyed by name, a timer both
+    # counts its calls and adds up their time.  The names used are:
+    #
+    #   tune                calls to TriCableSystem.tune() and their time
+    #   leastsqEvaluations  tryth() evaluations made by those calls
+    #   tuneMany            calls to TriCableSystem.tuneMany() and their time
+    #   tunedPositions      platform positions balanced by those calls
+    #   catenaryEvaluations positions evaluated by their root finding
+    #   terrain             terrain surface lookups and their time
+    #   terrainPoints       the number of points looked up
+    #   profiles            polar profile tables built and their time
+    #   cells               map cells inside the mast triangle attempted
+    #   balances            platform balances made finding their heights
+    #   platformMap         maps made and their time
+    #
+    # Counts accumulate over every call until reset().
+    #
+    # grids holds counts for each cell of the last map made by the scalar
+    # loop of platformMap(), as arrays over its grid keyed by name:
+    #
+    #   balances            platform balances made finding the cell's heights
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.counts = dict()
+        self.times = dict()
+        self.grids = dict()
+
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+    def timer(self, name):
+        # Returns a context manager which counts and times the code it wraps,
+        # or which does so between calls to its start() and stop().
+        return _Timer(self, name)
+
+
+    def merge(self, other):
+        # Adds the counts and times of other, e.g. those of a worker process.
+        for name, n in other.counts.items():
+            self.count(name, n)
+        for name, t in other.times.items():
+            self.times[name] = self.times.get(name, 0.0) + t
+
+
+    def perCell(self, name='balances'):
+        # Returns the mean of a count per map cell attempted.
+        cells = self.counts.get('cells', 0)
+        return self.counts.get(name, 0) / float(cells) if cells else float('nan')
+
+
+    def summary(self):
+        # Returns a table of the counts, times and the mean time of each.
+        lines = []
+        for name in sorted(self.counts):
+            n = self.counts[name]
+            line = '{:20} {:>12}'.format(name, n)
+            if name in self.times:
+                t = self.times[name]
+                line += ' {:12.3f} s {:12.3g} s each'.format(t, t / n if n else float('nan'))
+            lines.append(line)
+        if self.counts.get('cells'):
+            lines.append('{:20} {:>12.2f}'.format('balances per cell', self.perCell()))
+        return '\n'.join(lines)
+
+
+
+class _Timer:
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+
+    def start(self):
+        self.started = timeit.default_timer()
+        return self
+
+
+    def stop(self):
+        stats = self.stats
+        stats.times[self.name] = stats.times.get(self.name, 0.0) + timeit.default_timer() - self.started
+        stats.count(self.name)
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+
+class Progress:
+    # Base class of the progress callbacks taken by platformMap(monitor=...).
+    # The map calls start() with the number of cells to solve, update() with
+    # the number done since the last call and finish() at the end.  Override
+    # report() to show or log progress, cellsPerSecond() and eta() give the
+    # rate so far and the seconds left at that rate.
+
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+        self.started = None
+
+
+    def start(self, total):
+        self.total = total
+        self.done = 0
+        self.started = timeit.default_timer()
+        self.report()
+
+
+    def update(self, n=1):
+        self.done += n
+        self.report()
+
+
+    def finish(self):
+        self.report()
+
+
+    def elapsed(self):
+        return timeit.default_timer() - self.started if self.started is not None else 0.0
+
+
+    def cellsPerSecond(self):
+        t = self.elapsed()
+        return self.done / t if t > 0 else float('nan')
+
+
+    def eta(self):
+        rate = self.cellsPerSecond()
+        return (self.total - self.done) / rate if rate > 0 else float('nan')
+
+
+    def report(self):
+        pass
+
+
+
+class PrintProgress(Progress):
+    # Writes a line of progress to stream (stdout by default) at most every
+    # interval seconds, and when the map is finished.
+
+    def __init__(self, interval=10.0, stream=None):
+        Progress.__init__(self)
+        self.interval = interval
+        self.stream = stream
+        self.last = None
+
+
+    def report(self, force=False):
+        now = timeit.default_timer()
+        if not force and self.last is not None and now - self.last < self.interval:
+            return
+        self.last = now
+        stream = self.stream or sys.stdout
+        stream.write('{}/{} cells, {:.1f} cells/s, {} elapsed, ETA {}\n'.format(
+            self.done, self.total, self.cellsPerSecond(), formatSeconds(self.elapsed()), formatSeconds(self.eta())))
+        stream.flush()
+
+
+    def finish(self):
+        self.report(force=True)
+
+
+
+class CallbackProgress(Progress):
+    # Calls fn(done, total, cellsPerSecond, eta) on every update.
+
+    def __init__(self, fn):
+        Progress.__init__(self)
+        self.fn = fn
+
+
+    def report(self):
+        self.fn(self.done, self.total, self.cellsPerSecond(), self.eta())
+
+
+
+def progressMonitor(monitor):
+    # Returns monitor as a Progress: None gives one that does nothing and a
+    # function is wrapped in a CallbackProgress.
+    if monitor is None:
+        return Progress()
+    if isinstance(monitor, Progress):
+        return monitor
+    return CallbackProgress(monitor)
+
+
+def formatSeconds(t):
+    # Formats a time in seconds as h:mm:ss
+    if not t >= 0 or t == float('inf'):
+        return '?'
+    t = int(round(t))
+    return '{}:{:02}:{:02}'.format(t // 3600, t // 60 % 60, t % 60)
@@ -0,0 +1,200 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import scipy.ndimage
+
+
+# The arrays returned by platformMap(status=True), in order.
+mapArrays = ('xr', 'yr', 'zCeil', 'zFloor', 'zGround', 'floorTen', 'ceilTen', 'status')
+
+
+def digest(*parts):
+    # Returns a hex digest of numbers, arrays of numbers and strings.
+    h = hashlib.sha1()
+    for p in parts:
+        if isinstance(p, str):
+            h.update(p.encode('ascii'))
+        else:
+            a = np.array(-1 if p is None else p, dtype=float)
+            h.update(repr(a.shape).encode('ascii'))
+            h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def terrainFingerprint(terrain):
+    # Returns a hex digest identifying the terrain.  Uses the terrain's own
+    # fingerprint() where it has one, otherwise hashes the pickled terrain.
+    if hasattr(terrain, 'fingerprint'):
+        return terrain.fingerprint()
+    import pickle
+    return hashlib.sha1(pickle.dumps(terrain, 2)).hexdigest()
+
+
+def resample(result, xr, yr):
+    # Returns the ceiling and floor of the map result (as returned by
+    # platformMap()) bilinearly interpolated onto the grid xr, yr.  Points
+    # off the map, or next to a map cell without a solution, are NaN.
+    cxr, cyr = result[:2]
+    i = np.interp(yr, cyr, np.arange(len(cyr)), left=-1, right=len(cyr))
+    j = np.interp(xr, cxr, np.arange(len(cxr)), left=-1, right=len(cxr))
+    ii, jj = np.meshgrid(i, j, indexing='ij')
+    return [scipy.ndimage.map_coordinates(z, [ii, jj], order=1, cval=np.NaN) for z in result[2:4]]
+
+
+def mapFamily(installation, cableRes, heightRes, minClearance, maxTension, weight):
+    # Returns the hash of everything determining a map of the installation
+    # other than its grid and how it is computed.
+    tcs = installation.tcs
+    return digest(np.array(tcs.p, dtype=float), tcs.unitWeight, installation.polarRes,
+                  cableRes, heightRes, minClearance, maxTension, weight,
+                  terrainFingerprint(installation.terrain))
+
+
+class MapCache:
+    # Results of InstalledTCS.platformMap() kept on disk in cacheDir, up to
+    # maxBytes of them.  Each map is stored as a .npz file named for hashes
+    # of everything that determines it, so it is only reused for the same
+    # masts, cables, load, parameters and terrain.  When the cache is full
+    # the least recently used maps are deleted.
+    #
+    # Maps differing only in gridRes belong to the same family, and a coarser
+    # map of the family can seed the height searches for a finer one.
+
+    def __init__(self, cacheDir, maxBytes=2 ** 30):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+
+    def family(self, installation, cableRes, heightRes, minClearance, maxTension, weight):
+        # Returns the hash of everything determining a map of the
+        # installation other than its grid and how it is computed.
+        return mapFamily(installation, cableRes, heightRes, minClearance, maxTension, weight)
+
+
+    def path(self, family, gridRes, options):
+        # Returns the file for the family's map at gridRes computed with the
+        # given options, a tuple of the flags that select how it's computed.
+        return os.path.join(self.cacheDir, '{}-{}.npz'.format(family, digest(gridRes, *options)[:16]))
+
+
+    def load(self, path):
+        # Returns the map stored in path, or None if there isn't one.  Maps
+        # stored before cell status was kept don't have it.
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        try:
+            result = tuple([data[name] for name in mapArrays if name in data.files])
+        finally:
+            data.close()
+        # mark it as recently used
+        os.utime(path, None)
+        return result
+
+
+    def save(self, path, result, gridRes):
+        # Stores the map result in path, then evicts maps until the cache
+        # fits in maxBytes.
+        temp = path + '.part'
+        with open(temp, 'wb') as f:
+            np.savez(f, gridRes=gridRes, **dict(zip(mapArrays, result)))
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
+        self.evict()
+
+
+    def evict(self):
+        # Deletes the least recently used maps until the rest fit in maxBytes.
+        entries = []
+        for f in glob.glob(os.path.join(self.cacheDir, '*.npz')):
+            entries.append((os.path.getmtime(f), os.path.getsize(f), f))
+        entries.sort()
+
+        total = sum([size for mtime, size, f in entries])
+        for mtime, size, f in entries:
+            if total <= self.maxBytes:
+                break
+            os.remove(f)
+            total -= size
+
+
+    def coarser(self, family, gridRes):
+        # Returns the finest of the family's maps coarser than gridRes, or
+        # None if there aren't any.
+        best = None
+        for f in glob.glob(os.path.join(self.cacheDir, family + '-*.npz')):
+            data = np.load(f)
+            try:
+                res = float(data['gridRes'])
+            finally:
+                data.close()
+            if res > gridRes and (best is None or res < best[0]):
+                best = (res, f)
+        if best is None:
+            return None
+        return self.load(best[1])
+
+
+
+class MapCheckpoint:
+    # The chunks of a map being made by InstalledTCS.streamMap(), kept as they
+    # are solved so that a map which is interrupted can be resumed.  Each
+    # chunk is a .npz file in a directory within checkpointDir named for the
+    # map's family, grid and chunk size, so a restarted map only finds the
+    # chunks of the same map.  The stream clears them when the map is
+    # complete, a map given up on can be cleared with clear().
+
+    chunkArrays = ('idx', 'zCeil', 'zFloor', 'zGround', 'floorTen', 'ceilTen', 'status')
+
+    def __init__(self, checkpointDir, installation, gridRes, chunkSize, cableRes, heightRes, minClearance,
+                 maxTension, weight):
+        family = mapFamily(installation, cableRes, heightRes, minClearance, maxTension, weight)
+        self.mapDir = os.path.join(checkpointDir, '{}-{}'.format(family, digest(gridRes, chunkSize)[:16]))
+        if not os.path.isdir(self.mapDir):
+            os.makedirs(self.mapDir)
+
+
+    def path(self, chunk):
+        # Returns the file for the chunk of cells with flat indices chunk.
+        return os.path.join(self.mapDir, 'chunk-{}-{}.npz'.format(chunk[0], chunk[-1]))
+
+
+    def load(self, chunk):
+        # Returns the solution of the chunk, as InstalledTCS._mapChunk()
+        # returns it, or None if it hasn't been kept.
+        path = self.path(chunk)
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        try:
+            if not np.array_equal(data['chunk'], chunk):
+                return None
+            return tuple([data[name] for name in self.chunkArrays])
+        finally:
+            data.close()
+
+
+    def save(self, chunk, res):
+        # Keeps the solution res of the chunk.
+        temp = self.path(chunk) + '.part'
+        with open(temp, 'wb') as f:
+            np.savez(f, chunk=chunk, **dict(zip(self.chunkArrays, res)))
+        if os.path.exists(self.path(chunk)):
+            os.remove(self.path(chunk))
+        os.rename(temp, self.path(chunk))
+
+
+    def done(self):
+        # Returns the number of chunks kept.
+        return len(glob.glob(os.path.join(self.mapDir, 'chunk-*.npz')))
+
+
+    def clear(self):
+        # Deletes the chunks kept.
+        import shutil
+        shutil.rmtree(self.mapDir, ignore_errors=True)
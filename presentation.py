@@ -7,6 +7,7 @@ from matplotlib import cm
 import numpy as np
 
 import cableStatics as cs
+import siting
 
 from IPython.display import display, HTML
 
@@ -92,8 +93,15 @@ def showTcsCables2d(ax, tcs, showPlat=False):
 
 
 
+def axesPixels(ax):
+    # Returns the width and height of ax on screen in pixels, the finest
+    # terrain mesh worth contouring in it.
+    box = ax.get_window_extent()
+    return max(1, int(box.width)), max(1, int(box.height))
+
+
 def showInstallation3d(ax, itcs, nwLoc, swLoc):
-    x, y, z = itcs.terrain.surfaceMesh(nwLoc, swLoc)
+    x, y, z = itcs.terrain.surfaceMesh(nwLoc, swLoc, axesPixels(ax))
     ax.contour(x, y, z, 20, cmap=cm.coolwarm)
 
     ax.plot_surface(x, y, z, rstride=20, cstride=20, alpha=0.3, linewidth=0)
@@ -108,28 +116,163 @@ def showInstallation3d(ax, itcs, nwLoc, swLoc):
     showTcsCables(ax, itsc.tsc)
 
 
-def showInstallation2d(ax, itcs, nwLoc, swLoc, showPlat=False):
-    x, y, z = itcs.terrain.surfaceMesh(nwLoc, swLoc)
-    con = ax.contour(x, y, z, 20, cmap=cm.coolwarm)
-    cb = plt.colorbar(con, shrink=0.6, extend='both')
-    cb.set_label('Elevation [m]')
+def showInstallation2d(ax, itcs, nwLoc, swLoc, showPlat=False, mesh=None):
+    # mesh may give the terrain's surfaceMesh() over nwLoc to swLoc if it's
+    # been read already.  Returns the InstallationView drawn.
+    view = InstallationView(ax, itcs, nwLoc, swLoc, mesh)
+    view.update(showPlat)
+    return view
 
-    def show(fn, ind, form):
-        x, y, xc, yc = fn(ind)
-        ax.plot(x, y, 'k')
-        ax.text(xc, yc, form.format(ind), horizontalalignment='center', verticalalignment='center')
 
 
-    show(itcs.terrain.wsMapCoords, 18, 'WS{}')
+class InstallationView:
+    # A plan view of an installation, drawn in ax, which can be redrawn
+    # cheaply as the platform moves or the map shown over it changes.
+    #
+    # The terrain contours between nwLoc and swLoc, watershed 18 and the
+    # gradient plots are drawn once, when it's made.  update() moves the
+    # masts, cables and platform to where they are in itcs, and showMap()
+    # shows a map over the view, or replaces the one shown, as an image.
+    # Both change the data of the lines and image already drawn rather
+    # than drawing them again.  The terrain is contoured no finer than ax
+    # has pixels, see axesPixels().
 
-    for gp in [118, 218, 318]:
-        show(itcs.terrain.gpMapCoords, gp, '{}')
+    def __init__(self, ax, itcs, nwLoc, swLoc, mesh=None):
+        self.ax = ax
+        self.itcs = itcs
 
+        x, y, z = mesh if mesh is not None else itcs.terrain.surfaceMesh(nwLoc, swLoc, axesPixels(ax))
+        con = ax.contour(x, y, z, 20, cmap=cm.coolwarm)
+        cb = ax.figure.colorbar(con, ax=ax, shrink=0.6, extend='both')
+        cb.set_label('Elevation [m]')
 
-    ax.set_xlabel('metres east of local reference')
-    ax.set_ylabel('metres north of local reference')
+        def show(fn, ind, form):
+            x, y, xc, yc = fn(ind)
+            ax.plot(x, y, 'k')
+            ax.text(xc, yc, form.format(ind), horizontalalignment='center', verticalalignment='center')
+
+
+        show(itcs.terrain.wsMapCoords, 18, 'WS{}')
+
+        for gp in [118, 218, 318]:
+            show(itcs.terrain.gpMapCoords, gp, '{}')
+
+
+        ax.set_xlabel('metres east of local reference')
+        ax.set_ylabel('metres north of local reference')
+
+        # The moving parts, empty until update()
+        self.cables = [ax.plot([], [], 'g')[0] for i in range(3)]
+        self.platform = ax.plot([], [], 'ro')[0]
+        self.masts = ax.plot([], [], 'ro')[0]
+        self.mastLabels = [ax.text(0, 0, 'mast {}'.format(i+1), visible=False) for i in range(3)]
+
+        self.overlay = None
+        self.overlayBar = None
+
+
+    def update(self, showPlat=True, at=None):
+        # Moves the masts, and the cables and platform if showPlat, to where
+        # they are in itcs.tcs.  at, an (x, y) pair, puts the platform there
+        # instead, e.g. for a position that's been looked up but not solved.
+        # The cables are straight in plan, so are drawn to it as they are.
+        tcs = self.itcs.tcs
+        p = np.array(tcs.p)
+
+        self.masts.set_data(p[:, 0], p[:, 1])
+        self.ax.update_datalim(p[:, :2])
+        for i in range(3):
+            self.mastLabels[i].set_position((p[i][0], p[i][1]))
+            self.mastLabels[i].set_visible(True)
+
+        for i in range(3):
+            self.cables[i].set_visible(showPlat)
+        self.platform.set_visible(showPlat)
+        if not showPlat:
+            self.ax.autoscale_view()
+            return
+
+        pb = tcs.pb[:2] if at is None else at
+        for i in range(3):
+            self.cables[i].set_data([pb[0], p[i][0]], [pb[1], p[i][1]])
+        self.platform.set_data([pb[0]], [pb[1]])
+        self.ax.update_datalim([pb])
+        self.ax.autoscale_view()
+
+
+    def showMap(self, title, values, xr, yr):
+        # Shows values, on the grid xr by yr as returned by platformMap(),
+        # over the view, titled and with a colour bar labelled title.
+        ax = self.ax
+        step = [xr[1] - xr[0], yr[1] - yr[0]]
+        extent = [xr[0] - step[0] / 2.0, xr[-1] + step[0] / 2.0, yr[0] - step[1] / 2.0, yr[-1] + step[1] / 2.0]
+        values = np.ma.masked_invalid(values)
+
+        if self.overlay is None:
+            self.overlay = ax.imshow(values, extent=extent, origin='lower', interpolation='nearest', aspect='equal')
+            self.overlayBar = ax.figure.colorbar(self.overlay, ax=ax, shrink=0.6)
+        else:
+            self.overlay.set_data(values)
+            self.overlay.set_extent(extent)
+            self.overlay.set_clim(values.min(), values.max())
+            self.overlayBar.update_normal(self.overlay)
+        # Setting the image's extent fits the axes to it, fit them to
+        # everything again.
+        ax.autoscale_view()
+
+        ax.set_title(title)
+        self.overlayBar.set_label(title)
+
+
+
+class ProfileView:
+    # The cables above the terrain beneath them, and their clearance over
+    # the canopy, in six axes of fig.  Drawn once and updated with update()
+    # as the platform moves.
 
-    showTcsCables2d(ax, itcs.tcs, showPlat)
+    def __init__(self, fig):
+        self.fig = fig
+
+        top = fig.add_subplot(231, aspect='equal')
+        axt = [top, fig.add_subplot(232, sharex=top, sharey=top), fig.add_subplot(233, sharex=top, sharey=top)]
+
+        bottom = fig.add_subplot(234, sharex=top)
+        axb = [bottom, fig.add_subplot(235, sharex=top, sharey=bottom), fig.add_subplot(236, sharex=top, sharey=bottom)]
+
+        plt.setp(axt[1].get_yticklabels(), visible=False)
+        plt.setp(axt[2].get_yticklabels(), visible=False)
+        plt.setp(axb[1].get_yticklabels(), visible=False)
+        plt.setp(axb[2].get_yticklabels(), visible=False)
+
+        axt[0].set_ylabel('elevation [m]')
+        axb[0].set_ylabel('clearance from canopy [m]')
+
+        self.axt = axt
+        self.axb = axb
+        self.lines = []
+        for i in range(3):
+            plt.setp(axt[i].get_xticklabels(), visible=False)
+            axb[i].set_xlabel('distance from mast {} [m]'.format(i+1))
+            top = [axt[i].plot([], [], form)[0] for form in ['b-', 'g-', 'g-', 'ro', 'r-']]
+            bottom = axb[i].plot([], [], 'b')[0]
+            self.lines.append((top, bottom))
+
+
+    def update(self, d, zc, zt, zg):
+        # d, zt and zg are as returned by getTerrainBeneathCables() and zc by
+        # getCableClearance().
+        for i in range(3):
+            top, bottom = self.lines[i]
+            top[0].set_data(d[i], zc[i])
+            top[1].set_data(d[i], zt[i])
+            top[2].set_data(d[i], zg[i])
+            top[3].set_data([d[i][-1]], [zc[i][-1]])
+            top[4].set_data([0, 5], [zc[i][0], zg[i][0]])
+            bottom.set_data(d[i], zc[i] - zt[i])
+
+        for ax in self.axt + self.axb:
+            ax.relim()
+            ax.autoscale_view()
 
 
 
@@ -162,7 +305,7 @@ def coweetaMap():
     cow.loadStreams()
     cow.setWorkingRefPoint((277000, 3880000))
 
-    x, y, z = cow.surfaceMesh((-1e9, -1e9), (1e9, 1e9))
+    x, y, z = cow.surfaceMesh((-1e9, -1e9), (1e9, 1e9), axesPixels(ax))
     con = ax.contourf(x, y, z, 20, cmap=cm.coolwarm)
     cb = plt.colorbar(con, shrink=0.6, extend='both')
     cb.set_label('Elevation [m]')
@@ -196,29 +339,21 @@ def coweetaMap():
 
 def tcsMapAll(xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen, itcs):
 
-    gridRes = xr[1] - xr[0]
-    colHigh = zCeil - zGround
-    valid = np.isfinite(colHigh)
-    area = np.count_nonzero(valid) * gridRes ** 2
-    volume = np.sum(colHigh[valid]) * gridRes ** 2
+    area, volume = siting.accessible((xr, yr, zCeil, zFloor, zGround))
     s = '''<table>
     <tr><th>Accessible ground area</th><td>{:,} $m^2$</td></tr>
     <tr><th>Accessible airspace volume</th><td>{:,} $m^3$</td></tr>
     '''.format(int(area), int(volume))
     display(HTML(s))
 
-    def tcsMap(title, arg):
-        plt.figure(figsize=(14,10))
-
-        ax = plt.subplot(111, aspect='equal')
-        showInstallation2d(ax, itcs, [200,700], [1300,1500])
+    # One figure, its base drawn once, shown with each map in turn
+    fig = plt.figure(figsize=(14,10))
+    ax = fig.add_subplot(111, aspect='equal')
+    view = showInstallation2d(ax, itcs, [200,700], [1300,1500])
 
-        cs = plt.contourf(xr, yr, arg)
-
-        ax.set_title(title)
-
-        cb = plt.colorbar(cs, shrink=0.6)
-        cb.set_label(title)
+    def tcsMap(title, arg):
+        view.showMap(title, arg, xr, yr)
+        display(fig)
 
     tcsMap('Maximum Elevation of Platform [m]', zCeil)
     tcsMap('Minimum Safe Elevation of Platform [m]', zFloor)
@@ -231,4 +366,5 @@ def tcsMapAll(xr, yr, zCeil, zFloor, zGround, floorTen, ceilTen, itcs):
 
     tcsMap('Maximum Cable Tension To Hold Platform At Minimum Elevation [N]', np.max(floorTen, axis=2))
 
-
+    # Each map has been displayed, don't show the last again
+    plt.close(fig)
@@ -0,0 +1,158 @@
+import itertools
+
+import numpy as np
+import scipy.ndimage
+
+import installation
+
+
+def ridgeCandidates(terrain, spacing, radius=50.0, within=None):
+    # Returns an (N, 2) array of candidate mast locations on ridges of the
+    # terrain's ground surface, the highest ridge point in each spacing x
+    # spacing block.  A point is on a ridge if the ground there is higher
+    # than anywhere else within radius along some line across it:
+    # east-west, north-south or either diagonal.  Points within radius of the edge of
+    # the terrain aren't candidates, as what lies beyond them is unknown.
+    # within may limit the candidates to a polygon, an (M, 2) array of its
+    # vertices.
+    z = terrain.groundSampler.values(Ellipsis)
+    step = np.abs(terrain.step)
+
+    r = max(1, int(round(radius / min(step))))
+    lines = [np.ones((2 * r + 1, 1)), np.ones((1, 2 * r + 1)), np.eye(2 * r + 1), np.fliplr(np.eye(2 * r + 1))]
+    ridge = np.zeros(z.shape, dtype=bool)
+    for fp in lines:
+        # Strictly higher than the rest of the line, so a level line along
+        # a slope or flat ground isn't taken for a ridge
+        fp[fp.shape[0] // 2, fp.shape[1] // 2] = 0
+        ridge |= z > scipy.ndimage.maximum_filter(z, footprint=fp, mode='nearest')
+    ridge[:r] = ridge[-r:] = False
+    ridge[:, :r] = ridge[:, -r:] = False
+
+    i, j = np.nonzero(ridge)
+    loc = terrain.origin + np.column_stack((i, j)) * terrain.step
+    if within is not None:
+        import matplotlib.path as mplp
+        inside = mplp.Path(np.asarray(within)).contains_points(loc)
+        i, j, loc = i[inside], j[inside], loc[inside]
+
+    # The highest in each block
+    block = np.array(np.ceil(spacing / step), dtype=int)
+    key = (i // block[0]) * (z.shape[1] // block[1] + 1) + j // block[1]
+    order = np.lexsort((-z[i, j], key))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = key[order][1:] != key[order][:-1]
+    return loc[order[first]]
+
+
+def layouts(candidates, target, minSide=100.0, maxSide=1500.0):
+    # Returns the index triples of candidates that are worth mapping as mast
+    # layouts: their triangles contain the centroid of the target polygon
+    # and have sides between minSide and maxSide long.
+    import matplotlib.path as mplp
+    centre = np.mean(np.asarray(target, dtype=float), axis=0)
+    found = []
+    for tri in itertools.combinations(range(len(candidates)), 3):
+        p = candidates[list(tri)]
+        sides = np.sqrt(np.sum(np.square(p - np.roll(p, 1, axis=0)), axis=1))
+        if np.min(sides) < minSide or np.max(sides) > maxSide:
+            continue
+        if mplp.Path(p).contains_point(centre):
+            found.append(tri)
+    return found
+
+
+def accessible(result, polygon=None):
+    # Returns the accessible ground area and airspace volume of a map, as
+    # returned by platformMap(), counting only the cells within polygon if
+    # it's given.  These are the figures presentation.tcsMapAll() reports.
+    xr, yr, zCeil, zFloor, zGround = result[:5]
+    gridRes = xr[1] - xr[0]
+    colHigh = zCeil - zGround
+    valid = np.isfinite(colHigh)
+    if polygon is not None:
+        import matplotlib.path as mplp
+        x, y = np.meshgrid(xr, yr)
+        valid &= mplp.Path(np.asarray(polygon)).contains_points(np.column_stack((x.ravel(), y.ravel()))).reshape(
+            valid.shape)
+    return np.count_nonzero(valid) * gridRes ** 2, np.sum(colHigh[valid]) * gridRes ** 2
+
+
+def evaluate(itcs, masts, heights, gridRes, params, target=None):
+    # Maps the installation itcs with its masts at masts (3 x 2) of the given
+    # heights, returning the accessible area and volume over target and the
+    # map.  A layout the map can't be solved for scores nothing.
+    itcs.positionMasts(np.asarray(masts, dtype=float), np.asarray(heights, dtype=float))
+    try:
+        result = itcs.platformMap(gridRes=gridRes, vectorized=True, **params)
+    except RuntimeError:
+        return 0.0, 0.0, None
+    area, volume = accessible(result, target)
+    return area, volume, result
+
+
+def siteMasts(terrain, candidates, heights, target, params, coarseRes, gridRes, finalists=5, processes=None,
+              minSide=100.0, maxSide=1500.0):
+    """Searches for the mast layout giving the greatest accessible airspace
+    volume over the target polygon.
+
+    Each layout of three of the candidate locations (see ridgeCandidates())
+    found by layouts() is tried with each set of mast heights in heights, a
+    list of (h1, h2, h3).  All are first mapped at coarseRes, on a pool of
+    processes worker processes (None for one per CPU, 1 for none).  The
+    best finalists of them are then mapped again at gridRes.
+
+    params are the rest of the platformMap() arguments: cableRes, heightRes,
+    minClearance, maxTension and weight.
+
+    Returns the finalists best first, each as (volume, area, masts, heights,
+    map) with the volume, area and map at gridRes.
+    """
+    jobs = []
+    for tri in layouts(candidates, target, minSide, maxSide):
+        for h in heights:
+            jobs.append((candidates[list(tri)], h, coarseRes, params, target))
+
+    if processes == 1:
+        _initSitingWorker(terrain)
+        scores = [_sitingWorker(job) for job in jobs]
+    else:
+        import multiprocessing
+        spec = terrain.share() if hasattr(terrain, 'share') else terrain
+        n = processes or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(n, initializer=_initSitingWorker, initargs=(spec,))
+        try:
+            scores = pool.map(_sitingWorker, jobs, chunksize=max(1, len(jobs) // (4 * n)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    # Map the best at full resolution
+    best = np.argsort(scores)[::-1][:finalists]
+    itcs = installation.InstalledTCS(terrain)
+    found = []
+    for k in best:
+        masts, h = jobs[k][:2]
+        area, volume, result = evaluate(itcs, masts, h, gridRes, params, target)
+        found.append((volume, area, masts, h, result))
+    found.sort(key=lambda f: -f[0])
+    return found
+
+
+_worker = dict()
+
+
+def _initSitingWorker(terrainSpec):
+    import terrain
+    if isinstance(terrainSpec, terrain.SharedTerrain):
+        terrainSpec = terrainSpec.attach()
+    _worker['itcs'] = installation.InstalledTCS(terrainSpec)
+
+
+def _sitingWorker(job):
+    masts, heights, gridRes, params, target = job
+    area, volume, result = evaluate(_worker['itcs'], masts, heights, gridRes, params, target)
+    return volume
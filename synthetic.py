@@ -0,0 +1,119 @@
+import numpy as np
+import scipy.ndimage
+
+import terrain
+
+
+class SyntheticTerrain(terrain.RasterTerrain):
+    # A made up basin with the same surface methods as coweeta.Coweeta, for
+    # running and benchmarking without the Coweeta GIS files or GDAL.  The
+    # same seed always gives the same terrain.
+    #
+    # The ground rises from a stream valley running up the middle of the
+    # raster to ridges on either side, with side valleys and knolls cut
+    # across the slopes.  The canopy is taller in the coves than on the
+    # ridges and varies from stand to stand.  A watershed (18, as in
+    # Coweeta) covers the head of the main valley, with gradient plots 118,
+    # 218 and 318 running up its slope.
+
+    def __init__(self, size=(1600.0, 1600.0), step=5.0, seed=0, origin=(-100.0, -100.0), relief=300.0,
+                 canopyHeight=(15.0, 35.0)):
+        # size is the extent of the raster in metres east and north, step its
+        # spacing and origin the location of its south west corner.  relief
+        # is roughly the height of the ridges above the stream and
+        # canopyHeight the range of tree heights.
+        self.refPoint = (0, 0)
+        self.seed = seed
+        rs = np.random.RandomState(seed)
+
+        shape = np.array(np.round(np.array(size, dtype=float) / step), dtype=int) + 1
+        u = np.linspace(0, 1, shape[0])[:, np.newaxis]
+        v = np.linspace(0, 1, shape[1])[np.newaxis, :]
+
+        # The stream meanders northwards, the ground climbing away from it
+        # and up the valley.
+        freq, phase = rs.uniform(0.8, 1.2), rs.uniform()
+
+        def meander(v):
+            return 0.5 + 0.08 * np.sin(2 * np.pi * (v * freq + phase))
+
+        stream = meander(v)
+        across = (u - stream) / 0.5
+        zg = relief * (0.25 * v + 0.75 * (1 - np.exp(-np.square(across / 0.45))))
+
+        # Spurs and side valleys running down to the stream, sharp crested
+        ridges = np.zeros(zg.shape)
+        for n in range(4):
+            k = rs.uniform(3, 7)
+            angle = rs.uniform(-0.6, 0.6)
+            phase = rs.uniform(0, 2 * np.pi)
+            wave = np.sin(np.pi * k * (v * np.cos(angle) + np.abs(across) * np.sin(angle)) + phase)
+            ridges += (0.5 - np.abs(wave)) / (n + 1)
+        zg += 0.12 * relief * ridges * np.minimum(1, np.abs(across) * 3)
+
+        # Smaller knolls and hollows
+        rough = scipy.ndimage.gaussian_filter(rs.normal(size=zg.shape), 60.0 / step, mode='nearest')
+        zg += 0.05 * relief * rough / np.std(rough)
+        zg += 700
+
+        # Trees are tallest in the moist coves below the mean elevation and
+        # vary in patches of a few hundred metres.
+        stand = scipy.ndimage.gaussian_filter(rs.normal(size=zg.shape), 40.0 / step, mode='nearest')
+        stand = np.clip(0.5 + 0.25 * stand / np.std(stand), 0, 1)
+        cove = 1 / (1 + np.exp((zg - np.mean(zg)) / (0.1 * relief)))
+        hLow, hHigh = canopyHeight
+        self.canopyHeight = hLow + (hHigh - hLow) * np.clip(0.5 * cove + 0.5 * stand, 0, 1)
+
+        self.noData = np.zeros(zg.shape, dtype=bool)
+        self.worldOrigin = np.array(origin, dtype=float)
+        terrain.RasterTerrain.__init__(self, zg, zg + self.canopyHeight, self.worldOrigin, [step, step])
+
+        # Watershed 18 is the upper third of the valley, between the ridge
+        # crests.
+        lo, hi = self.range()
+        span = hi - lo
+        along = np.linspace(0.6, 0.95, 8)
+        ys = lo[1] + span[1] * along
+        centre = lo[0] + span[0] * meander(along)
+        half = 0.3 * span[0]
+        east = np.column_stack((centre + half, ys))
+        west = np.column_stack((centre - half, ys))[::-1]
+        ws = np.vstack((east, west, east[:1]))
+        self.watershed = {18: ws}
+
+        # 80m square gradient plots from the stream to the ridge
+        self.gradientPlot = dict()
+        square = np.array([[0, 0], [80, 0], [80, 80], [0, 80], [0, 0]], dtype=float)
+        base = np.array([centre[3], ys[3]])
+        for i, gp in enumerate([118, 218, 318]):
+            self.gradientPlot[gp] = square + base + [i * 0.3 * half, -40]
+
+
+    def setWorkingRefPoint(self, loc):
+        # Set a local reference point.
+        self.refPoint = loc
+        self.origin = self.worldOrigin - loc
+
+
+    def wsBoundary(self, wsNum):
+        points = self.watershed[wsNum] - self.refPoint
+        return points[:, 0], points[:, 1], self.groundSurface(points)
+
+
+    def gpBoundary(self, gsNum):
+        points = self.gradientPlot[gsNum] - self.refPoint
+        return points[:, 0], points[:, 1], self.groundSurface(points)
+
+
+    def gpMapCoords(self, gsNum):
+        points = self.gradientPlot[gsNum] - self.refPoint
+        x = points[:, 0]
+        y = points[:, 1]
+        return x, y, (min(x) + max(x)) / 2, (min(y) + max(y)) / 2
+
+
+    def wsMapCoords(self, wsNum):
+        points = self.watershed[wsNum] - self.refPoint
+        x = points[:, 0]
+        y = points[:, 1]
+        return x, y, (min(x) + max(x)) / 2, (min(y) + 2 * max(y)) / 3
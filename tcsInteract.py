@@ -1,3 +1,8 @@
+import io
+import threading
+import time
+import traceback
+
 import installation as inst
 from IPython.display import display, HTML
 # from IPython.html.widgets import interact
@@ -14,6 +19,21 @@ class InteractiveTscModel:
     def __init__(self, cow):
         self.cow = cow
         self.itcs = inst.InstalledTCS(cow)
+        self.tableParams = None
+        self.table = None
+        self.worker = None
+
+        # What's been worked out so far, kept while the inputs it depends on
+        # don't change.
+        self.placed = None
+        self.planView = None
+        self.profileView = None
+        self.groundKey = None
+        self.ground = None
+        self.profileKey = None
+        self.profile = None
+        self.lastInputs = None
+        self.lastResult = None
 
 
     def initialMastPositions(self, mastCoords):
@@ -28,36 +48,113 @@ class InteractiveTscModel:
         self.platHeight = height
 
 
-    def interact(self):
-
+    def placeMasts(self):
+        # Positions the masts, unless they're where they were last put.
+        # Everything worked out for the old positions is dropped.
+        placed = (self.mastCoords.tolist(), np.array(self.mastHeights, dtype=float).tolist())
+        if placed == self.placed:
+            return
         self.itcs.positionMasts(self.mastCoords, self.mastHeights)
+        self.placed = placed
+        self.profileKey = None
+        self.profile = None
+        self.lastInputs = None
+        self.lastResult = None
+
+
+    def views(self):
+        # The plan and profile figures, drawn once and updated for each
+        # platform position.  They're kept out of pyplot, so are shown with
+        # display() or drawn to images.
+        if self.planView is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            fig = Figure(figsize=(12,8))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111, aspect='equal')
+            self.planView = pres.InstallationView(ax, self.itcs, [0,500], [1500,1500])
+
+            fig = Figure(figsize=(12,8))
+            FigureCanvasAgg(fig)
+            self.profileView = pres.ProfileView(fig)
+        return self.planView, self.profileView
+
+
+    def useLookupTable(self, gridRes=25.0, heightRes=10.0, weights=(100, 250, 500, 750, 1000)):
+        # Have the sliders look the platform up in a table rather than solve
+        # for the cables at every move, so they keep up.  The table is built
+        # by interact() over the masts' bounding box, gridRes apart, at every
+        # heightRes of the height slider and for each of weights.  The plan
+        # follows the sliders, the cables are solved exactly and their
+        # profiles drawn when Solve is pressed.
+        self.tableParams = (gridRes, heightRes, weights)
+
+
+    def interact(self, background=False, delay=0.2):
+        # Shows sliders positioning the platform, and its readings and plots.
+        #
+        # If background is True the platform is solved and drawn on a
+        # background thread, once the sliders have been still for delay
+        # seconds, so the sliders never wait for it.  A solve that's
+        # overtaken by another slider move is abandoned.  With a lookup table
+        # (useLookupTable()) the readings from it are shown straight away in
+        # the meantime.
+
+        # The old worker mustn't be moving the platform while the masts are
+        # placed, or alongside a new one
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker.join()
+            self.worker = None
+
+        self.placeMasts()
 
         swExtent = self.mastCoords.min(axis=0)
         neExtent = self.mastCoords.max(axis=0)
 
-        w = widgets.interactive(
-            self.posPlatform,
+        sliders = dict(
             xPlat=widgets.FloatSliderWidget(min=swExtent[0], max=neExtent[0], value=self.platCoord[0], step=1.0),
             yPlat=widgets.FloatSliderWidget(min=swExtent[1], max=neExtent[1], value=self.platCoord[1], step=1.0),
             height=widgets.FloatSliderWidget(min=0, max=200, value=self.platHeight),
             weight=widgets.FloatSliderWidget(min=0, max=1000, value=500)
         )
 
-        display.display(w)
+        if self.tableParams is not None:
+            gridRes, heightRes, weights = self.tableParams
+            self.table = self.itcs.workspaceTable(gridRes, np.arange(0, 200 + heightRes * 0.5, heightRes), weights,
+                                                  cableRes=10)
+
+        if background:
+            self.worker = LatestRequestWorker(self.render, delay)
+            self.readings = widgets.HTMLWidget()
+            self.planImage = widgets.ImageWidget(format='png')
+            self.profileImage = widgets.ImageWidget(format='png')
+            w = widgets.interactive(self.requestPlatform, **sliders)
+            display.display(w)
+            display.display(self.readings)
+            display.display(self.planImage)
+            display.display(self.profileImage)
+            return
 
+        if self.table is None:
+            w = widgets.interactive(self.posPlatform, **sliders)
+            display.display(w)
+            return
 
-    def posPlatform(self, xPlat, yPlat, height, weight):
+        w = widgets.interactive(self.lookupPlatform, **sliders)
+        solve = widgets.ButtonWidget(description='Solve')
+        solve.on_click(lambda b: self.posPlatform(**w.kwargs))
 
-        def tableRow(title, form, vals):
-            return '<tr><th>' + title + '</th>' + ' '.join([('<td>' + form + '</td>').format(x) for x in vals]) + '</tr>\n'
+        display.display(w)
+        display.display(solve)
 
-        okay = self.itcs.positionPlatform([xPlat, yPlat], height, weight)
-        if not okay:
-            print 'One or more cables would need to be in compression to position the platform {}m above ({},{})'.format(height,xPlat,yPlat)
-            return
 
-        d, zt, zg = self.itcs.getTerrainBeneathCables(resolution=10)
-        zc, mc = self.itcs.getCableClearance(d, zt)
+    def readingsHtml(self, lengths, tensions, mc, note=''):
+        # Returns a table of the cable lengths and tensions and the minimum
+        # canopy clearance, as HTML.
+        def tableRow(title, form, vals):
+            return '<tr><th>' + title + '</th>' + ' '.join([('<td>' + form + '</td>').format(x) for x in vals]) + '</tr>\n'
 
         if mc < 1.0:
             attr = ' style="color:red;"'
@@ -66,54 +163,192 @@ class InteractiveTscModel:
 
         s = '<table>\n'
         s += tableRow('Cable', '{}', range(1, 4))
-        s += tableRow('Length [m]', '{:0.0f}', [self.itcs.tcs.c[i].length() for i in range(3)])
-        s += tableRow('Tension [N]', '{:0.0f}', self.itcs.tcs.tensionAtMasts())
+        s += tableRow('Length [m]', '{:0.0f}', lengths)
+        s += tableRow('Tension [N]', '{:0.0f}', tensions)
         s += '</table>\n'
-        s += '<p{}>Minimum canopy clearance: {:0.2f}m</p>\n'.format(attr, mc)
-
-        display.display(HTML(s))
-
-        plt.figure(figsize=(12,8))
-
+        s += '<p{}>Minimum canopy clearance: {:0.2f}m{}</p>\n'.format(attr, mc, note)
+        return s
+
+
+    def showReadings(self, lengths, tensions, mc, note=''):
+        display.display(HTML(self.readingsHtml(lengths, tensions, mc, note)))
+
+
+    def lookupHtml(self, xPlat, yPlat, height, weight, action='press Solve'):
+        # Returns the readings from the lookup table as HTML.
+        tensions, lengths, mc = self.table.lookup(xPlat, yPlat, height, weight)
+        if np.any(np.isnan(tensions)) or np.isnan(mc):
+            return '<p>Outside the lookup table or close to a cable in compression, {}</p>'.format(action)
+        return self.readingsHtml(lengths, tensions, mc, ' (approximate, {} to check)'.format(action))
+
+
+    def lookupPlatform(self, xPlat, yPlat, height, weight):
+        # The slider handler with a lookup table, see useLookupTable().  The
+        # plan follows the platform too, the profiles wait for Solve as they
+        # need the cables solved.
+        display.display(HTML(self.lookupHtml(xPlat, yPlat, height, weight)))
+
+        plan, profiles = self.views()
+        plan.update(at=(xPlat, yPlat))
+        display.display(plan.ax.figure)
+
+
+    def solve(self, xPlat, yPlat, height, weight, cancelled=None):
+        # Positions the platform, returning a dict of the cable lengths and
+        # tensions, the least clearance and the profiles beneath the cables,
+        # or None if cancelled() turns True on the way.
+        #
+        # Only what depends on the inputs that changed is worked out again.
+        # The ground height and the terrain beneath the cables depend only on
+        # the platform's x and y, so are kept when just the height or weight
+        # change.  The same inputs again give the same result, so long as
+        # the platform is still where they put it.
+        inputs = (xPlat, yPlat, height, weight)
+        if inputs == self.lastInputs:
+            return self.lastResult
+
+        xy = (xPlat, yPlat)
+        if xy != self.groundKey:
+            self.ground = self.cow.groundSurface(np.array(xy))
+            self.groundKey = xy
+        # The platform is moved even if this is cancelled, so the last result
+        # no longer describes it
+        self.lastInputs = None
+        self.lastResult = None
+        okay = self.itcs.positionPlatform(xy, height, weight, ground=self.ground)
+        if cancelled is not None and cancelled():
+            return None
+
+        res = dict(okay=okay)
+        if okay:
+            if self.profileKey != xy:
+                self.profile = self.itcs.getTerrainBeneathCables(resolution=10)
+                self.profileKey = xy
+            d, zt, zg = self.profile
+            zc, mc = self.itcs.getCableClearance(d, zt)
+            res.update(d=d, zt=zt, zg=zg, zc=zc, mc=mc, lengths=[self.itcs.tcs.c[i].length() for i in range(3)],
+                       tensions=self.itcs.tcs.tensionAtMasts())
+
+        self.lastInputs = inputs
+        self.lastResult = res
+        return res
 
-        ax = plt.subplot(111, aspect='equal')
-        pres.showInstallation2d(ax, self.itcs, [0,500], [1500,1500], showPlat=True)
 
-        plt.figure(figsize=(12,8))
-        axt = range(3)
-        axb = range(3)
-        # fig, axes = plt.subplots(ncols=3, nrows=2, sharex=True, sharey=True)
-        # plt.setp(axes.flat, aspect=1.0, adjustable='box')
-
-
-        axt[0] = plt.subplot(231, aspect='equal')
-        axt[1] = plt.subplot(232, sharex=axt[0], sharey=axt[0]) #, aspect='equal')
-        axt[2] = plt.subplot(233, sharex=axt[0], sharey=axt[0]) #, aspect='equal')
+    def posPlatform(self, xPlat, yPlat, height, weight):
 
-        axb[0] = plt.subplot(234, sharex=axt[0])
-        axb[1] = plt.subplot(235, sharex=axt[0], sharey=axb[0])
-        axb[2] = plt.subplot(236, sharex=axt[0], sharey=axb[0])
+        res = self.solve(xPlat, yPlat, height, weight)
+        if not res['okay']:
+            print 'One or more cables would need to be in compression to position the platform {}m above ({},{})'.format(height,xPlat,yPlat)
+            return
 
-        plt.setp(axt[1].get_yticklabels(), visible=False)
-        plt.setp(axt[2].get_yticklabels(), visible=False)
-        plt.setp(axb[1].get_yticklabels(), visible=False)
-        plt.setp(axb[2].get_yticklabels(), visible=False)
+        self.showReadings(res['lengths'], res['tensions'], res['mc'])
 
+        plan, profiles = self.views()
+        plan.update()
+        display.display(plan.ax.figure)
+        profiles.update(res['d'], res['zc'], res['zt'], res['zg'])
+        display.display(profiles.fig)
 
-        axt[0].set_ylabel('elevation [m]')
-        axb[0].set_ylabel('clearance from canopy [m]')
-        for i in range(3):
 
-            plt.setp(axt[i].get_xticklabels(), visible=False)
-            axt[i].plot(d[i], zc[i], 'b-')
-            axt[i].plot(d[i], zt[i], 'g-')
-            axt[i].plot(d[i], zg[i], 'g-')
-            axt[i].plot(d[i][-1], zc[i][-1], 'ro')
-            axt[i].plot([0, 5], [zc[i][0], zg[i][0]], 'r-')
+    def requestPlatform(self, xPlat, yPlat, height, weight):
+        # The slider handler in the background, see interact().
+        if self.table is not None:
+            self.readings.value = self.lookupHtml(xPlat, yPlat, height, weight, 'solving')
+        self.worker.submit(xPlat, yPlat, height, weight)
 
-            axb[i].set_xlabel('distance from mast {} [m]'.format(i+1))
 
-            axb[i].plot(d[i], zc[i] - zt[i], 'b')
+    def render(self, cancelled, xPlat, yPlat, height, weight):
+        # Solves and draws the platform on the background thread, giving up
+        # as soon as it's been superseded.  The figures are drawn to images.
+        res = self.solve(xPlat, yPlat, height, weight, cancelled)
+        if res is None or cancelled():
+            return
+        if not res['okay']:
+            self.readings.value = ('<p>One or more cables would need to be in compression to position the '
+                                   'platform {}m above ({},{})</p>'.format(height, xPlat, yPlat))
+            return
+        self.readings.value = self.readingsHtml(res['lengths'], res['tensions'], res['mc'])
 
+        def png(fig):
+            out = io.BytesIO()
+            fig.canvas.print_png(out)
+            return out.getvalue()
 
+        plan, profiles = self.views()
+        plan.update()
+        image = png(plan.ax.figure)
+        if cancelled():
+            return
+        self.planImage.value = image
 
+        profiles.update(res['d'], res['zc'], res['zt'], res['zg'])
+        image = png(profiles.fig)
+        if cancelled():
+            return
+        self.profileImage.value = image
+
+
+
+class LatestRequestWorker:
+    # Runs fn(cancelled, *args) on a background thread for the latest of the
+    # requests submitted, once none has come for delay seconds.  Requests
+    # overtaken before they start are dropped.  Once one has started,
+    # cancelled() returns True as soon as another is submitted, so fn can
+    # give up on it.
+
+    def __init__(self, fn, delay=0.2):
+        self.fn = fn
+        self.delay = delay
+        self.lock = threading.Condition()
+        self.serial = 0
+        self.pending = None
+        self.stopped = False
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def submit(self, *args):
+        with self.lock:
+            self.serial += 1
+            self.pending = (self.serial, time.time(), args)
+            self.lock.notify()
+
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.serial += 1
+            self.lock.notify()
+
+
+    def join(self, timeout=None):
+        # Waits for the thread to finish, once stopped.  A request being
+        # worked on is cancelled, but fn only gives up at its next check.
+        self.thread.join(timeout)
+
+
+    def run(self):
+        while True:
+            with self.lock:
+                # Wait until a request has been left alone for delay
+                while not self.stopped:
+                    if self.pending is None:
+                        self.lock.wait()
+                        continue
+                    wait = self.pending[1] + self.delay - time.time()
+                    if wait <= 0:
+                        break
+                    self.lock.wait(wait)
+                if self.stopped:
+                    return
+                serial, submitted, args = self.pending
+                self.pending = None
+
+            try:
+                self.fn(lambda: self.serial != serial, *args)
+            except Exception:
+                # Keep going for the next request, the last error is kept
+                self.error = traceback.format_exc()
@@ -0,0 +1,439 @@
+import hashlib
+
+import numpy as np
+import scipy.ndimage
+
+
+# Interpolation orders by name, any of these or an integer spline order may be
+# given wherever an order is asked for.
+interpolationOrders = {'nearest': 0, 'bilinear': 1, 'cubic': 3}
+
+
+def interpolationOrder(order):
+    # Returns the spline order for an order given by name or number.
+    if order in interpolationOrders:
+        return interpolationOrders[order]
+    return int(order)
+
+
+class SurfaceSampler:
+    # Samples a raster layer at fractional array indices.
+    #
+    # Spline interpolation above order 1 first needs the whole raster
+    # filtered into spline coefficients.  scipy.ndimage.map_coordinates does
+    # that on every call, even for a single point.  Here it is done once for
+    # each order used and the coefficients are kept, so a lookup only costs
+    # the interpolation itself.
+    #
+    # The layer may be stored compactly (e.g. int16), the value it represents
+    # is z * scale + offset.
+
+    def __init__(self, z, order='cubic', scale=1.0, offset=0.0):
+        self.z = z
+        self.order = order
+        self.scale = scale
+        self.offset = offset
+        self.coefficients = dict()
+        self.overviews = dict()
+
+
+    def shifted(self, dz):
+        # Returns a sampler for this layer raised by dz.  It shares the layer
+        # and its coefficient and overview caches rather than holding a copy
+        # of any.
+        s = SurfaceSampler(self.z, self.order, self.scale, self.offset + dz)
+        s.coefficients = self.coefficients
+        s.overviews = self.overviews
+        return s
+
+
+    def reset(self):
+        # Forget the cached coefficients and overviews.  Needed if z is
+        # modified in place.
+        self.coefficients.clear()
+        self.overviews.clear()
+
+
+    def getCoefficients(self, order):
+        # Returns the array to interpolate for the given spline order.
+        if order < 2:
+            return self.z
+        if order not in self.coefficients:
+            output = np.float32 if self.z.dtype.itemsize < 8 else np.float64
+            self.coefficients[order] = scipy.ndimage.spline_filter(self.z, order=order, output=output)
+        return self.coefficients[order]
+
+
+    def maxOver(self, lo, hi, order=None):
+        # Returns an upper bound on the sampled surface within each box of
+        # fractional indices from lo to hi, (N, 2) arrays of corners.
+        #
+        # A spline interpolated value is a weighted average, with positive
+        # weights, of the coefficients within (order + 1) / 2 elements of it.
+        # So the largest coefficient within reach of a box bounds the surface
+        # over it, which a MaxPyramid of the coefficients gives cheaply.
+        order = interpolationOrder(self.order if order is None else order)
+        key = ('max', order)
+        if key not in self.coefficients:
+            self.coefficients[key] = MaxPyramid(self.getCoefficients(order))
+
+        reach = (order + 1) // 2
+        top = np.array(self.z.shape) - 1
+        lo = np.clip(np.floor(lo) - reach, 0, top).astype(int)
+        hi = np.clip(np.floor(hi) + reach + 1, 0, top).astype(int)
+        return self.coefficients[key].maxOver(lo[:, 0], lo[:, 1], hi[:, 0], hi[:, 1]) * self.scale + self.offset
+
+
+    def overview(self, level, noData=None):
+        # Returns the layer decimated 2**level times along each axis, as
+        # values.  Each element is the mean of a 2**level square block of the
+        # layer, leaving out the elements flagged in noData (an array like z),
+        # and NaN if none are left.  Level 0 is the layer itself.
+        #
+        # The levels are kept for each noData array, each built from the one
+        # below it, so the layer is read once for all of them.  The array is
+        # known by its identity, so it mustn't be modified in place.
+        if level == 0:
+            z = self.values(Ellipsis)
+            if noData is not None:
+                z[np.asarray(noData)] = np.NaN
+            return z
+
+        # Holding on to noData keeps its id from being reused
+        key = None if noData is None else id(noData)
+        if key not in self.overviews:
+            self.overviews[key] = (noData, dict())
+        levels = self.overviews[key][1]
+
+        if level not in levels:
+            if level == 1:
+                # From the layer a slab of rows at a time, so a memory mapped
+                # layer isn't read in whole as floats.
+                parts = []
+                for i in range(0, self.z.shape[0], 1024):
+                    z = np.asarray(self.z[i:i + 1024], dtype=float)
+                    count = np.ones(z.shape) if noData is None else ~np.asarray(noData[i:i + 1024])
+                    parts.append(halveLayer(z, count))
+                levels[level] = tuple(np.concatenate(p) for p in zip(*parts))
+            else:
+                self.overview(level - 1, noData)
+                levels[level] = halveLayer(*levels[level - 1])
+
+        return levels[level][0] * self.scale + self.offset
+
+
+    def values(self, index):
+        # Returns the layer values at grid points selected by index, as
+        # indexing z would.
+        return np.asarray(self.z[index], dtype=float) * self.scale + self.offset
+
+
+    def sample(self, locI, order=None):
+        # Returns the layer value at locI, either a single (2,) pair of
+        # indices or an (N, 2) array of them.  order defaults to self.order.
+        order = interpolationOrder(self.order if order is None else order)
+        coeffs = self.getCoefficients(order)
+        locI = np.asarray(locI)
+        if locI.shape == (2,):
+            z = scipy.ndimage.map_coordinates(coeffs, locI.reshape(2, 1), output=np.float64, order=order,
+                                              prefilter=False)[0]
+        else:
+            z = scipy.ndimage.map_coordinates(coeffs, locI.transpose(), output=np.float64, order=order,
+                                              prefilter=False)
+        return z * self.scale + self.offset
+
+
+class MaxPyramid:
+    # Hierarchy of maxima of a 2D array.  Level 0 is the array itself and
+    # each level above holds the maximum of each 2x2 block of the one below.
+    # The maximum over any rectangle of the array is then bounded by four
+    # elements of the level where the rectangle spans at most two blocks.
+
+    def __init__(self, z):
+        self.levels = [z]
+        while max(z.shape) > 1:
+            nx, ny = z.shape
+            padded = np.ones((nx + nx % 2, ny + ny % 2)) * -np.inf
+            padded[:nx, :ny] = z
+            z = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=3).max(axis=1)
+            self.levels.append(z)
+
+
+    def maxOver(self, i0, j0, i1, j1):
+        # Returns an upper bound on the maximum of the array over each of the
+        # index ranges [i0, i1] x [j0, j1] (inclusive, arrays of ints within
+        # the array).  The bound covers at most 4x the area asked for.
+        extent = np.maximum(i1 - i0, j1 - j0)
+        level = np.array(np.ceil(np.log2(extent + 1)), dtype=int)
+
+        result = np.empty(extent.shape)
+        for n in np.unique(level):
+            sel = level == n
+            z = self.levels[n]
+            a0, a1, b0, b1 = [v[sel] >> n for v in (i0, i1, j0, j1)]
+            result[sel] = np.maximum(np.maximum(z[a0, b0], z[a0, b1]), np.maximum(z[a1, b0], z[a1, b1]))
+        return result
+
+
+def halveLayer(z, count):
+    # Returns the mean of each 2x2 block of z, weighting each element by
+    # count, and the total count of each block.  Blocks with no count are
+    # NaN.  A last odd row or column makes blocks of its own.
+    nx, ny = z.shape
+    shape = (nx + nx % 2, ny + ny % 2)
+    weight = np.zeros(shape)
+    weight[:nx, :ny] = count
+    total = np.zeros(shape)
+    total[:nx, :ny] = np.where(count > 0, z, 0) * count
+
+    def blockSum(a):
+        return a.reshape(shape[0] // 2, 2, shape[1] // 2, 2).sum(axis=3).sum(axis=1)
+
+    weight, total = blockSum(weight), blockSum(total)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / weight, weight
+
+
+def layerDigest(z, rows=256):
+    # Returns a hex digest of array z's type, shape and contents, hashed a
+    # few rows at a time so a memory mapped layer isn't read in all at once.
+    h = hashlib.sha1(repr((z.dtype.str, z.shape)).encode('ascii'))
+    for i in range(0, z.shape[0], rows):
+        h.update(np.ascontiguousarray(z[i:i + rows]).tobytes())
+    return h.hexdigest()
+
+
+def compactLayer(z, dtype='float64', nodata=None):
+    # Returns z converted for storage as dtype, along with the scale and
+    # offset that recover its values.  For int16 an integer z is kept as is
+    # when it fits, anything else is quantised to span the int16 range.
+    # Elements equal to nodata, or NaN, are stored as zero height.
+    z = np.asarray(z)
+    missing = np.isnan(z) if z.dtype.kind == 'f' else np.zeros(z.shape, dtype=bool)
+    if nodata is not None:
+        missing |= z == nodata
+    dtype = np.dtype(dtype)
+
+    if dtype.kind != 'i':
+        out = np.array(z, dtype=dtype)
+        out[missing] = 0
+        return out, 1.0, 0.0
+
+    valid = z[~missing]
+    lo, hi = (valid.min(), valid.max()) if valid.size else (0, 0)
+    info = np.iinfo(dtype)
+    if z.dtype.kind in 'iu' and lo >= info.min + 1 and hi <= info.max:
+        scale, offset = 1.0, 0.0
+    else:
+        scale = max(float(hi - lo), 1e-9) / (info.max - info.min - 1)
+        offset = float(lo + hi) / 2
+    out = np.array(np.round((z - offset) / scale), dtype=dtype)
+    out[missing] = np.round(-offset / scale)
+    return out, scale, offset
+
+
+def storeArray(a, storeDir=None, name='layer'):
+    # Returns a with its storage moved to a read only memory mapped .npy file
+    # in storeDir, so it is paged in from disk as needed instead of held in
+    # memory.  If storeDir is None a is returned unchanged.
+    if storeDir is None:
+        return a
+    import os
+    if not os.path.isdir(storeDir):
+        os.makedirs(storeDir)
+    path = os.path.join(storeDir, name + '.npy')
+    m = np.lib.format.open_memmap(path, mode='w+', dtype=a.dtype, shape=a.shape)
+    m[...] = a
+    m.flush()
+    del m
+    return np.load(path, mmap_mode='r')
+
+
+class RasterTerrain:
+    # Ground and canopy surfaces from rasters, with the same lookup methods as
+    # coweeta.Coweeta but without needing GDAL.  Layers are indexed [x, y] and
+    # placed by the location of element [0, 0] (origin) and the spacing
+    # between elements (step).
+    #
+    # zCanopy may be given as a single number, the height of the canopy above
+    # the ground everywhere.  The canopy is then sampled from the ground layer
+    # rather than stored.
+
+    def __init__(self, zGround, zCanopy, origin, step, order='cubic', scale=1.0, offset=0.0):
+        self.zg0 = zGround
+        self.origin = np.array(origin, dtype=float)
+        self.step = np.array(step, dtype=float)
+
+        self.groundSampler = SurfaceSampler(self.zg0, order, scale, offset)
+        if np.isscalar(zCanopy):
+            self.canopySampler = self.groundSampler.shifted(zCanopy)
+        else:
+            self.canopySampler = SurfaceSampler(zCanopy, order)
+        self.layerDigests = None
+
+
+    def setInterpolation(self, order):
+        # Choose how the ground and canopy surfaces are interpolated between
+        # raster points: 'nearest', 'bilinear', 'cubic' or a spline order.
+        # Cubic is the default, the others are cheaper but less smooth.
+        self.groundSampler.order = order
+        self.canopySampler.order = order
+
+
+    def locationToIndices(self, loc):
+        # Scales the given (x,y) coordinates to correspond with the indexing of
+        # the raster arrays.
+        return (loc - self.origin) / self.step
+
+
+    def range(self):
+        # Returns two (x,y) points, one at either corner of the raster data.
+        return self.origin, self.origin + self.step * self.zg0.shape
+
+
+    def surfaceMesh(self, p1, p2, size=None):
+        # Returns x, y and z grids of the ground surface over the rectangle
+        # with corners p1 and p2, at the raster points within it.  Points
+        # flagged in noData, if the terrain has one, are NaN.
+        #
+        # size may give the number of points wanted across x and y, a pair
+        # or one number for both, for a mesh only as fine as it'll be shown,
+        # e.g. the axes' size in pixels.  The mesh is then taken from the
+        # coarsest overview of the ground (see SurfaceSampler.overview())
+        # that still has at least that many points across the rectangle.
+        noData = getattr(self, 'noData', None)
+        p1i, p2i = self.locationToIndices(p1), self.locationToIndices(p2)
+
+        p1i, p2i = np.min([p1i, p2i], axis=0), np.max([p1i, p2i], axis=0)
+
+        p1i = np.array(np.floor(np.max([p1i, (0, 0)],         axis=0)), dtype=int)
+        p2i = np.array(np.ceil( np.min([p2i, self.zg0.shape], axis=0)), dtype=int)
+
+        level = 0
+        if size is not None:
+            spare = np.min((p2i - p1i) / np.array(size, dtype=float))
+            if spare >= 2:
+                level = min(int(np.floor(np.log2(spare))), int(np.ceil(np.log2(max(self.zg0.shape)))))
+
+        if level == 0:
+            xi, yi = [np.arange(p1i[a], p2i[a]) for a in [0, 1]]
+            xr, yr = [np.arange(p1i[a], p2i[a]) * self.step[a] + self.origin[a] for a in [0, 1]]
+
+            x, y = np.meshgrid(xr, yr)
+            index = (xi, np.reshape(yi, (len(yi), 1)))
+            z = self.groundSampler.values(index)
+            if noData is not None:
+                z[noData[index]] = np.NaN
+
+            return x, y, z
+
+        # Blocks overlapping the rectangle, placed at their centres
+        block = 2 ** level
+        zl = self.groundSampler.overview(level, noData)
+        k1 = p1i // block
+        k2 = np.minimum(-(-p2i // block), zl.shape)
+        xr, yr = [(np.arange(k1[a], k2[a]) * block + (block - 1) / 2.0) * self.step[a] + self.origin[a]
+                  for a in [0, 1]]
+
+        x, y = np.meshgrid(xr, yr)
+        z = zl[k1[0]:k2[0], k1[1]:k2[1]].transpose()
+
+        return x, y, z
+
+
+    def groundSurface(self, loc, order=None):
+        # Returns the z coordinate on the ground surface at loc.  order
+        # overrides the interpolation set by setInterpolation().
+        return self.groundSampler.sample(self.locationToIndices(loc), order)
+
+
+    def canopySurface(self, loc, order=None):
+        # Returns the z coordinate on the canopy surface at loc
+        return self.canopySampler.sample(self.locationToIndices(loc), order)
+
+
+    def canopyMaxOver(self, p1, p2):
+        # Returns an upper bound on the canopy surface within each box with
+        # corners p1 and p2, (N, 2) arrays of locations.
+        i1, i2 = self.locationToIndices(p1), self.locationToIndices(p2)
+        return self.canopySampler.maxOver(np.minimum(i1, i2), np.maximum(i1, i2))
+
+
+    def fingerprint(self):
+        # Returns a hex digest identifying the ground and canopy surfaces, for
+        # recognising results computed on the same terrain.  The layers are
+        # only hashed the first time, set layerDigests to None if they are
+        # modified in place.
+        samplers = (self.groundSampler, self.canopySampler)
+        if self.layerDigests is None:
+            ground = layerDigest(self.groundSampler.z)
+            canopy = self.canopySampler.z
+            self.layerDigests = [ground, ground if canopy is self.groundSampler.z else layerDigest(canopy)]
+
+        h = hashlib.sha1()
+        for s, d in zip(samplers, self.layerDigests):
+            h.update(d.encode('ascii'))
+            h.update(repr((s.scale, s.offset, interpolationOrder(s.order))).encode('ascii'))
+        h.update(np.array([self.origin, self.step], dtype=float).tobytes())
+        return h.hexdigest()
+
+
+    def share(self):
+        # Returns a SharedTerrain with the layers in shared memory, for
+        # handing to worker processes.
+        return SharedTerrain(self)
+
+
+def sharedArray(a):
+    # Returns a copy of array a in shared memory, as the multiprocessing
+    # buffer and the information needed to view it as an array again.
+    import multiprocessing
+    a = np.ascontiguousarray(a)
+    raw = multiprocessing.RawArray('b', max(a.nbytes, 1))
+    np.frombuffer(raw, dtype=a.dtype, count=a.size)[:] = a.ravel()
+    return raw, a.dtype.str, a.shape
+
+
+def viewShared(spec):
+    # Returns an array view of a buffer made by sharedArray().
+    raw, dtype, shape = spec
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+class SharedTerrain:
+    # The layers of a terrain copied into shared memory along with the spline
+    # coefficients for its interpolation order, so each worker process can
+    # sample the terrain without loading or filtering its own copy.  Must be
+    # passed to the workers when they are created, e.g. in the initargs of a
+    # multiprocessing.Pool, and then attach() called in the worker.
+
+    def __init__(self, terrain):
+        self.origin = np.array(terrain.origin)
+        self.step = np.array(terrain.step)
+        self.order = terrain.groundSampler.order
+
+        # A canopy composed from the ground layer shares its buffers.
+        order = interpolationOrder(self.order)
+        ground = terrain.groundSampler
+        self.layers = []
+        for sampler in (ground, terrain.canopySampler):
+            if sampler is not ground and sampler.z is ground.z:
+                self.layers.append(self.layers[0][:2] + (sampler.scale, sampler.offset))
+                continue
+            coeffs = sharedArray(sampler.getCoefficients(order)) if order > 1 else None
+            self.layers.append((sharedArray(sampler.z), coeffs, sampler.scale, sampler.offset))
+
+
+    def attach(self):
+        # Returns a RasterTerrain reading the shared layers.
+        order = interpolationOrder(self.order)
+        samplers = []
+        for z, coeffs, scale, offset in self.layers:
+            s = SurfaceSampler(viewShared(z), self.order, scale, offset)
+            if coeffs is not None:
+                s.coefficients[order] = viewShared(coeffs)
+            samplers.append(s)
+
+        t = RasterTerrain(samplers[0].z, 0, self.origin, self.step, self.order)
+        t.groundSampler, t.canopySampler = samplers
+        return t